@@ -0,0 +1,243 @@
+"""Load test of every route of sql_app.main against a seeded database.
+
+    python -m benchmarks.run --membros 10000 --planos 50 --concurrency 1 10 50 --output benchmarks/results/run.json
+
+The app is driven in-process through httpx's ASGI transport, so the numbers measure the app and the
+database, not the network. Each scenario reports p50/p95/p99 latency, throughput and SQL statements
+per request; the JSON output carries the git commit so runs can be compared across commits.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///benchmarks/bench.db", help="SQLite file or local MySQL (mysql+pymysql://...)")
+    parser.add_argument("--membros", type=int, default=10000)
+    parser.add_argument("--planos", type=int, default=50)
+    parser.add_argument("--planos-por-membro", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--only", nargs="*", help="run only the scenarios whose name contains one of these strings")
+    parser.add_argument("--output", default="benchmarks/results/latest.json")
+    return parser.parse_args(argv)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def percentile(values: list, q: float):
+    # Nearest-rank percentile of the sorted values
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class Scenarios:
+    """Requests for every route. Write scenarios draw fresh ids, so every level of concurrency starts from a valid state."""
+
+    def __init__(self, membros: int, planos: int):
+        self.membros = membros
+        self.planos = planos
+        # Plans with no membros, used by the membro/plano mutations
+        self.plano_avulso = planos + 1
+        self.plano_lote = planos + 2
+        self.next_membro = itertools.count(membros * 10 + 1)
+        self.next_plano = itertools.count(planos * 10 + 1)
+        self.membros_criados = []
+        self.planos_criados = []
+        self.membros_avulso = []
+        self.lotes = []
+
+    def setup_requests(self):
+        return [("POST", "/planos/bulk", {"json": [self.plano(self.plano_avulso), self.plano(self.plano_lote)]})]
+
+    def membro(self, id_membro: int):
+        return {
+            "id_membro": id_membro, "nome_membro": f"Membro {id_membro}", "peso": 80.0, "sexo": "M",
+            "data_inscricao_plano_atual": "2023-01-01T00:00:00", "data_inscricao_academia": "2023-01-01T00:00:00",
+            "data_nascimento": "1990-01-01T00:00:00", "rg": f"{id_membro:09d}",
+        }
+
+    def plano(self, id_plano: int):
+        return {
+            "id_plano": id_plano, "nome_plano": f"Plano {id_plano}", "preco": 99.9, "multa_valor_fidelidade": 50,
+            "tempo_fidelidade": 6, "tempo_duracao": 12, "beneficios": "Musculação", "ativo": True,
+        }
+
+    def all(self):
+        # (name, request factory); the factory gets the request index within the scenario
+        membro_id = lambda i: i % self.membros + 1
+        plano_id = lambda i: i % self.planos + 1
+        return [
+            ("GET /", lambda i: ("GET", "/", {})),
+            ("GET /membros?limit=100", lambda i: ("GET", "/membros?limit=100", {})),
+            ("GET /membros?limit=100&include=planos", lambda i: ("GET", "/membros?limit=100&include=planos", {})),
+            ("GET /membros?sort=-peso&peso_min=70&limit=100", lambda i: ("GET", "/membros?sort=-peso&peso_min=70&limit=100", {})),
+            ("GET /membros?nome=Membro 1&fields=id_membro,nome_membro&limit=100", lambda i: ("GET", "/membros?nome=Membro%201&fields=id_membro,nome_membro&limit=100", {})),
+            ("GET /membros", lambda i: ("GET", "/membros", {})),
+            ("GET /membros?stream=true", lambda i: ("GET", "/membros?stream=true", {})),
+            ("GET /planos", lambda i: ("GET", "/planos", {})),
+            ("GET /membro/{id}", lambda i: ("GET", f"/membro/{membro_id(i)}", {})),
+            ("GET /plano/{id}", lambda i: ("GET", f"/plano/{plano_id(i)}", {})),
+            ("GET /membros/ativos", lambda i: ("GET", "/membros/ativos", {})),
+            ("GET /membros/{id_plano}", lambda i: ("GET", f"/membros/{plano_id(i)}", {})),
+            ("GET /planos/{id_membro}", lambda i: ("GET", f"/planos/{membro_id(i)}", {})),
+            ("GET /changes?limit=100", lambda i: ("GET", "/changes?limit=100", {})),
+            ("GET /stats/planos", lambda i: ("GET", "/stats/planos", {})),
+            ("GET /stats/receita", lambda i: ("GET", "/stats/receita", {})),
+            ("GET /stats/inscricoes", lambda i: ("GET", "/stats/inscricoes", {})),
+            ("GET /stats/sexos", lambda i: ("GET", "/stats/sexos", {})),
+            ("POST /membro", lambda i: ("POST", "/membro", {"json": self.novo_membro()})),
+            ("POST /plano", lambda i: ("POST", "/plano", {"json": self.novo_plano()})),
+            ("POST /membros/bulk", lambda i: ("POST", "/membros/bulk", {"json": [self.novo_membro() for _ in range(10)]})),
+            ("POST /planos/bulk", lambda i: ("POST", "/planos/bulk", {"json": [self.novo_plano() for _ in range(10)]})),
+            ("PATCH /membro", lambda i: ("PATCH", "/membro", {"json": {"id_membro": membro_id(i), "peso": 80.0 + i % 10}})),
+            ("PATCH /membro password", lambda i: ("PATCH", "/membro", {"json": {"id_membro": membro_id(i), "password": "senha"}})),
+            ("PATCH /plano", lambda i: ("PATCH", "/plano", {"json": {"id_plano": plano_id(i), "preco": 99.9 + i % 10}})),
+            ("PUT /membro/{id}/plano/{id}", lambda i: ("PUT", f"/membro/{self.avulso(i)}/plano/{self.plano_avulso}", {})),
+            ("DELETE /membro/{id}/plano/{id}", lambda i: ("DELETE", f"/membro/{self.membros_avulso.pop()}/plano/{self.plano_avulso}", {})),
+            ("PUT /membros/planos", lambda i: ("PUT", "/membros/planos", {"json": self.lote(i)})),
+            ("DELETE /membros/planos", lambda i: ("DELETE", "/membros/planos", {"json": self.lotes.pop()})),
+            ("DELETE /membro/{id}", lambda i: ("DELETE", f"/membro/{self.membros_criados.pop()}", {})),
+            ("DELETE /plano/{id}", lambda i: ("DELETE", f"/plano/{self.planos_criados.pop()}", {})),
+            ("GET /metrics/pool", lambda i: ("GET", "/metrics/pool", {})),
+            ("GET /metrics/hashing", lambda i: ("GET", "/metrics/hashing", {})),
+            ("GET /metrics/cache", lambda i: ("GET", "/metrics/cache", {})),
+            ("GET /metrics/sql", lambda i: ("GET", "/metrics/sql", {})),
+            ("GET /metrics/coalescing", lambda i: ("GET", "/metrics/coalescing", {})),
+            ("GET /ready", lambda i: ("GET", "/ready", {})),
+        ]
+
+    def novo_membro(self):
+        id_membro = next(self.next_membro)
+        self.membros_criados.append(id_membro)
+        return dict(self.membro(id_membro), password="senha")
+
+    def novo_plano(self):
+        id_plano = next(self.next_plano)
+        self.planos_criados.append(id_plano)
+        return self.plano(id_plano)
+
+    def avulso(self, i: int):
+        id_membro = (i * 7919) % self.membros + 1
+        self.membros_avulso.append(id_membro)
+        return id_membro
+
+    def lote(self, i: int):
+        lote = {"id_plano": self.plano_lote, "ids_membro": [(i * 100 + j) % self.membros + 1 for j in range(100)]}
+        self.lotes.append(lote)
+        return lote
+
+
+async def run_scenario(client, factory, concurrency: int, total: int, sql_counter: list):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencias = []
+    erros = 0
+
+    async def one(i: int):
+        nonlocal erros
+        async with semaphore:
+            method, url, kwargs = factory(i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            latencias.append(time.perf_counter() - started)
+            erros += not ok
+
+    sql_antes = sql_counter[0]
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencias.sort()
+    return {
+        "requests": total,
+        "errors": erros,
+        "throughput_rps": round(total / elapsed, 2),
+        "latency_ms": {
+            "p50": round(percentile(latencias, 0.50) * 1000, 3),
+            "p95": round(percentile(latencias, 0.95) * 1000, 3),
+            "p99": round(percentile(latencias, 0.99) * 1000, 3),
+            "mean": round(statistics.fmean(latencias) * 1000, 3),
+        },
+        "sql_statements_per_request": round((sql_counter[0] - sql_antes) / total, 2),
+    }
+
+
+async def run(args):
+    import httpx
+    from sqlalchemy import event
+    from sql_app import database, hashing, models
+    from benchmarks.seed import seed
+
+    print(f"Seeding {args.membros} membros, {args.planos} planos...", file=sys.stderr)
+    started = time.perf_counter()
+    seed(database.engine, models, args.membros, args.planos, args.planos_por_membro, args.seed)
+    seed_seconds = time.perf_counter() - started
+
+    from sql_app.main import app
+
+    # Every statement sent to the database, read before and after each scenario
+    sql_counter = [0]
+    @event.listens_for(database.engine, "before_cursor_execute")
+    def count_statement(*args):
+        sql_counter[0] += 1
+
+    scenarios = Scenarios(args.membros, args.planos)
+    results = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=None) as client:
+        for method, url, kwargs in scenarios.setup_requests():
+            (await client.request(method, url, **kwargs)).raise_for_status()
+
+        for concurrency in args.concurrency:
+            for name, factory in scenarios.all():
+                if args.only and not any(only in name for only in args.only):
+                    continue
+                result = await run_scenario(client, factory, concurrency, args.requests, sql_counter)
+                results.append({"scenario": name, "concurrency": concurrency, **result})
+                print(f"{name:40} c={concurrency:<4} {result['throughput_rps']:>9} req/s  "
+                      f"p50={result['latency_ms']['p50']:>9}ms  p99={result['latency_ms']['p99']:>9}ms  "
+                      f"sql/req={result['sql_statements_per_request']:>7}  errors={result['errors']}", file=sys.stderr)
+    hashing.shutdown()
+
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "database": database.engine.dialect.name,
+        "dataset": {"membros": args.membros, "planos": args.planos, "planos_por_membro": args.planos_por_membro, "seed": args.seed},
+        "seed_seconds": round(seed_seconds, 3),
+        "results": results,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Point the app at the benchmark database before sql_app is imported
+    os.environ["DATABASE_URL"] = args.database_url
+
+    report = asyncio.run(run(args))
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+
+
+def membro_row(id_membro: int, rnd: random.Random):
+    nascimento = datetime(1960, 1, 1) + timedelta(days=rnd.randint(0, 40 * 365))
+    inscricao = nascimento + timedelta(days=rnd.randint(16 * 365, 20 * 365))
+    return dict(
+        id_membro=id_membro,
+        nome_membro=f"Membro {id_membro}",
+        peso=round(rnd.uniform(45, 130), 1),
+        sexo=rnd.choice("MF"),
+        data_inscricao_plano_atual=inscricao,
+        data_inscricao_academia=inscricao,
+        data_nascimento=nascimento,
+        rg=f"{id_membro:09d}",
+        # Already "hashed": seeding shouldn't pay bcrypt for every row
+        hashed_password="$2b$10$" + "x" * 53,
+    )
+
+def plano_row(id_plano: int, rnd: random.Random):
+    tempo_duracao = rnd.choice([1, 3, 6, 12])
+    return dict(
+        id_plano=id_plano,
+        nome_plano=f"Plano {id_plano}",
+        preco=round(rnd.uniform(60, 300), 2),
+        multa_valor_fidelidade=rnd.randint(1, 200),
+        tempo_fidelidade=rnd.randint(1, tempo_duracao),
+        tempo_duracao=tempo_duracao,
+        beneficios="Musculação, Aeróbico, Vestiário",
+        ativo=rnd.random() < 0.7,
+    )
+
+def seed(engine, models, membros: int, planos: int, planos_por_membro: int, seed: int = 0, batch_size: int = 5000):
+    # Recreate the schema and fill it through the models layer, deterministically for a given seed
+    rnd = random.Random(seed)
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.PlanosSQL), [plano_row(id_plano, rnd) for id_plano in range(1, planos + 1)])
+
+        for start in range(1, membros + 1, batch_size):
+            ids = range(start, min(start + batch_size, membros + 1))
+            conn.execute(insert(models.MembrosSQL), [membro_row(id_membro, rnd) for id_membro in ids])
+
+            associacoes = [
+                {"membro_id": id_membro, "plano_id": id_plano}
+                for id_membro in ids
+                for id_plano in rnd.sample(range(1, planos + 1), rnd.randint(0, min(planos_por_membro, planos)))
+            ]
+            if associacoes:
+                conn.execute(insert(models.membro_plano_association), associacoes)
@@ -0,0 +1,32 @@
+import os
+
+# Production launcher: gunicorn sql_app.main:app -c gunicorn.conf.py (or sql_app.main_async:app)
+# Run the migrations once before starting it (alembic upgrade head), the workers don't create the schema
+
+bind = f"0.0.0.0:{os.getenv('PORT', 80)}"
+
+# Each worker is a separate process with its own connection pool (the database sees up to
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections), planos cache, ETag versions and hashing pool.
+# The cache and the versions are only invalidated in the worker that served the write, so with more than one
+# worker the app turns the planos cache and the ETags off, unless shared backends are plugged (see cache.py and
+# etags.py). The hashing pools split the CPUs between the workers
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+
+# uvicorn runs each worker on uvloop and httptools, since they're installed
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# The app is imported by each worker after the fork, not by the master: forked workers would share its pool's connections
+preload_app = False
+
+# A worker that doesn't answer for this long is restarted. It includes the warmup of a new worker
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-')
+
+
+def on_starting(server):
+    # The workers read WEB_CONCURRENCY to size their hashing pool and to know whether their caches can be trusted,
+    # so it must match the actual count, also when it's given with -w
+    os.environ["WEB_CONCURRENCY"] = str(server.cfg.workers)
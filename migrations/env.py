@@ -0,0 +1,34 @@
+from logging.config import fileConfig
+from sqlalchemy import create_engine, pool
+from alembic import context
+from sql_app import models
+from sql_app.database import SQLALCHEMY_DATABASE_URL
+
+config = context.config
+
+# Set up the loggers from alembic.ini
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+# Models metadata, used by --autogenerate
+target_metadata = models.Base.metadata
+
+
+def run_migrations_offline():
+    # Emit the SQL of the migrations instead of running it (alembic upgrade head --sql)
+    context.configure(url=SQLALCHEMY_DATABASE_URL, target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    connectable = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=pool.NullPool)
+    with connectable.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=connection.dialect.name == "sqlite")
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,72 @@
+"""Baseline: schema created by Base.metadata.create_all before migrations were introduced
+
+Databases created by the app before this revision already have this schema, mark them with:
+
+    alembic stamp 0001
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 10:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.mysql import VARCHAR
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Every column of both tables had index=True
+MEMBROS_INDEXES = ['id_membro', 'nome_membro', 'peso', 'sexo', 'data_inscricao_plano_atual', 'data_inscricao_academia', 'data_nascimento', 'rg', 'hashed_password']
+PLANOS_INDEXES = ['id_plano', 'nome_plano', 'preco', 'multa_valor_fidelidade', 'tempo_fidelidade', 'tempo_duracao', 'beneficios', 'ativo']
+
+
+def upgrade():
+    op.create_table('membros',
+        sa.Column('id_membro', sa.Integer, primary_key=True),
+        sa.Column('nome_membro', VARCHAR(100)),
+        sa.Column('peso', sa.Float),
+        sa.Column('sexo', VARCHAR(1)),
+        sa.Column('data_inscricao_plano_atual', sa.DateTime, nullable=True),
+        sa.Column('data_inscricao_academia', sa.DateTime),
+        sa.Column('data_nascimento', sa.DateTime),
+        sa.Column('rg', VARCHAR(20)),
+        sa.Column('hashed_password', VARCHAR(200)),
+        sa.CheckConstraint('peso > 0', name='peso_positivo'),
+        sa.CheckConstraint('data_inscricao_academia > data_nascimento', name='data_inscricao_academia_valida'),
+    )
+    for column in MEMBROS_INDEXES:
+        op.create_index(f'ix_membros_{column}', 'membros', [column])
+
+    op.create_table('planos',
+        sa.Column('id_plano', sa.Integer, primary_key=True),
+        sa.Column('nome_plano', VARCHAR(100)),
+        sa.Column('preco', sa.Float),
+        sa.Column('multa_valor_fidelidade', sa.Integer),
+        sa.Column('tempo_fidelidade', sa.Integer),
+        sa.Column('tempo_duracao', sa.Integer),
+        sa.Column('beneficios', VARCHAR(500)),
+        sa.Column('ativo', sa.Boolean),
+        sa.CheckConstraint('preco > 0', name='preco_positivo'),
+        sa.CheckConstraint('multa_valor_fidelidade > 0', name='multa_valor_fidelidade_positivo'),
+        sa.CheckConstraint('tempo_fidelidade > 0', name='tempo_fidelidade_positivo'),
+        sa.CheckConstraint('tempo_duracao > 0', name='tempo_duracao_positivo'),
+        sa.CheckConstraint('tempo_fidelidade <= tempo_duracao', name='tempo_fidelidade_menor_igual_tempo_duracao'),
+        sa.CheckConstraint('tempo_fidelidade = 0 or multa_valor_fidelidade > 0', name='multa_valor_fidelidade_valido'),
+    )
+    for column in PLANOS_INDEXES:
+        op.create_index(f'ix_planos_{column}', 'planos', [column])
+
+    # No primary key and no indexes (besides the ones MySQL creates for the foreign keys)
+    op.create_table('membro_plano_association',
+        sa.Column('membro_id', sa.Integer, sa.ForeignKey('membros.id_membro')),
+        sa.Column('plano_id', sa.Integer, sa.ForeignKey('planos.id_plano')),
+    )
+
+
+def downgrade():
+    op.drop_table('membro_plano_association')
+    op.drop_table('planos')
+    op.drop_table('membros')
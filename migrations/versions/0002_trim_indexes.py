@@ -0,0 +1,88 @@
+"""Trim the secondary indexes, composite primary key on membro_plano_association
+
+Every column of membros and planos was indexed, so each write maintained about ten B-trees that
+no query used: every lookup goes through the primary keys. Only the indexes the queries need are kept:
+
+- membro_plano_association gets the (plano_id, membro_id) primary key, which also rejects
+  duplicated links, and the reverse (membro_id, plano_id) index for the planos of a membro;
+- planos gets (ativo, id_plano), for the active plans lookup of GET /membros/ativos.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 10:30:00
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+MEMBROS_INDEXES = ['id_membro', 'nome_membro', 'peso', 'sexo', 'data_inscricao_plano_atual', 'data_inscricao_academia', 'data_nascimento', 'rg', 'hashed_password']
+PLANOS_INDEXES = ['id_plano', 'nome_plano', 'preco', 'multa_valor_fidelidade', 'tempo_fidelidade', 'tempo_duracao', 'beneficios', 'ativo']
+
+
+# Offline (alembic upgrade --sql) there's no database to inspect, the schema is assumed to be the 0001 one
+
+def _index_names(table: str):
+    if context.is_offline_mode():
+        return {f'ix_{table}_{column}' for column in {'membros': MEMBROS_INDEXES, 'planos': PLANOS_INDEXES}.get(table, [])}
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+def _has_primary_key(table: str):
+    if context.is_offline_mode():
+        return False
+    return bool(sa.inspect(op.get_bind()).get_pk_constraint(table)['constrained_columns'])
+
+def _rebuild_association(primary_key: bool):
+    # Copy the links into a new table and swap it in, the simplest way to change the primary key on both MySQL and SQLite.
+    # MySQL wants the foreign key names unique in the schema, and the old table keeps its own until it's dropped:
+    # only the upgrade names them, the downgrade leaves them unnamed like 0001 (MySQL then derives them from the new table)
+    columns = [
+        sa.Column('membro_id', sa.Integer, sa.ForeignKey('membros.id_membro', name='fk_membro_plano_membro_id' if primary_key else None), nullable=not primary_key),
+        sa.Column('plano_id', sa.Integer, sa.ForeignKey('planos.id_plano', name='fk_membro_plano_plano_id' if primary_key else None), nullable=not primary_key),
+    ]
+    if primary_key:
+        columns.append(sa.PrimaryKeyConstraint('plano_id', 'membro_id', name='pk_membro_plano'))
+    op.create_table('membro_plano_association_new', *columns)
+
+    # Duplicated and incomplete links can't go into the primary key, and were never read correctly anyway
+    op.execute(
+        "INSERT INTO membro_plano_association_new (membro_id, plano_id) "
+        "SELECT DISTINCT membro_id, plano_id FROM membro_plano_association "
+        "WHERE membro_id IS NOT NULL AND plano_id IS NOT NULL"
+    )
+    op.drop_table('membro_plano_association')
+    op.rename_table('membro_plano_association_new', 'membro_plano_association')
+
+
+def upgrade():
+    existing = _index_names('membros')
+    for column in MEMBROS_INDEXES:
+        if f'ix_membros_{column}' in existing:
+            op.drop_index(f'ix_membros_{column}', table_name='membros')
+
+    existing = _index_names('planos')
+    for column in PLANOS_INDEXES:
+        if f'ix_planos_{column}' in existing:
+            op.drop_index(f'ix_planos_{column}', table_name='planos')
+    op.create_index('ix_planos_ativo_id_plano', 'planos', ['ativo', 'id_plano'])
+
+    # Databases created by create_all after the primary key was added to the model already have it
+    if not _has_primary_key('membro_plano_association'):
+        _rebuild_association(primary_key=True)
+    if 'ix_membro_plano_membro_id_plano_id' not in _index_names('membro_plano_association'):
+        op.create_index('ix_membro_plano_membro_id_plano_id', 'membro_plano_association', ['membro_id', 'plano_id'])
+
+
+def downgrade():
+    op.drop_index('ix_membro_plano_membro_id_plano_id', table_name='membro_plano_association')
+    _rebuild_association(primary_key=False)
+
+    op.drop_index('ix_planos_ativo_id_plano', table_name='planos')
+    for column in PLANOS_INDEXES:
+        op.create_index(f'ix_planos_{column}', 'planos', [column])
+    for column in MEMBROS_INDEXES:
+        op.create_index(f'ix_membros_{column}', 'membros', [column])
@@ -0,0 +1,28 @@
+"""Indexes for the filters and sort keys of GET /membros
+
+Each index leads with the filtered/sorted column and ends with id_membro, so a range filter, its ORDER BY
+and the keyset condition of the next page are all answered by one index range scan.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 14:00:00
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ['nome_membro', 'peso', 'data_inscricao_academia', 'data_nascimento']
+
+
+def upgrade():
+    for column in COLUMNS:
+        op.create_index(f'ix_membros_{column}_id_membro', 'membros', [column, 'id_membro'])
+
+
+def downgrade():
+    for column in COLUMNS:
+        op.drop_index(f'ix_membros_{column}_id_membro', table_name='membros')
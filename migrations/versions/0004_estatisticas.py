@@ -0,0 +1,30 @@
+"""Summary table of the /stats reports
+
+Filled by the refresher of sql_app/stats.py when STATS_SUMMARY_REFRESH is set, so the dashboards read
+one row per report instead of aggregating the base tables.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 16:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.mysql import VARCHAR
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('estatisticas',
+        sa.Column('nome', VARCHAR(50), primary_key=True),
+        sa.Column('dados', sa.Text(16777215)),
+        sa.Column('atualizado_em', sa.DateTime, nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('estatisticas')
@@ -0,0 +1,28 @@
+"""Row versions of membros and planos
+
+Incremented by every PATCH, which with If-Match only updates the row while it's still at the version the
+client read (optimistic concurrency), instead of reading it first.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 17:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('membros', 'planos'):
+        op.add_column(table, sa.Column('versao', sa.Integer, nullable=False, server_default='1'))
+
+
+def downgrade():
+    for table in ('membros', 'planos'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('versao')
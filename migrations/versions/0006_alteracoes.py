@@ -0,0 +1,36 @@
+"""Outbox of the writes to membros, planos and their association
+
+Every write appends to it in its own transaction, and GET /changes serves it incrementally to the consumers
+that used to poll the full listings. Entries older than CHANGES_RETENTION are pruned by the app.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 18:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.mysql import VARCHAR
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('alteracoes',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer, 'sqlite'), primary_key=True, autoincrement=True),
+        sa.Column('tabela', VARCHAR(30), nullable=False),
+        sa.Column('operacao', VARCHAR(10), nullable=False),
+        sa.Column('id_membro', sa.Integer, nullable=True),
+        sa.Column('id_plano', sa.Integer, nullable=True),
+        sa.Column('dados', sa.Text, nullable=True),
+        sa.Column('criado_em', sa.DateTime, nullable=False),
+    )
+    op.create_index('ix_alteracoes_criado_em', 'alteracoes', ['criado_em'])
+
+
+def downgrade():
+    op.drop_index('ix_alteracoes_criado_em', table_name='alteracoes')
+    op.drop_table('alteracoes')
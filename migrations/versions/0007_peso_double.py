@@ -0,0 +1,33 @@
+"""membros.peso as DOUBLE
+
+Float is a single-precision FLOAT on MySQL: a weight sent back by the clients (a double, e.g. in the keyset of
+GET /membros?sort=peso or in peso_min/peso_max) never compares equal to the stored 70.3, so the pages repeated the
+rows that share a weight. SQLite's REAL is already a double, there only the declared type changes.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 19:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('membros') as batch_op:
+        batch_op.alter_column('peso', type_=sa.Double, existing_type=sa.Float, existing_nullable=True)
+    if op.get_context().dialect.name != 'mysql':
+        return
+    # The FLOAT widens to its exact binary value (70.3 becomes 70.30000305175781): round it back to the 7 significant
+    # digits a FLOAT holds, which is the value the clients sent and were shown
+    op.execute("UPDATE membros SET peso = ROUND(peso, 6 - FLOOR(LOG10(peso))) WHERE peso > 0")
+
+
+def downgrade():
+    with op.batch_alter_table('membros') as batch_op:
+        batch_op.alter_column('peso', type_=sa.Float, existing_type=sa.Double, existing_nullable=True)
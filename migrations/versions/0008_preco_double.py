@@ -0,0 +1,31 @@
+"""planos.preco as DOUBLE
+
+Same as 0007 for the price: on MySQL a PATCH resending the current preco (a double) never compared equal to the
+stored FLOAT, so it bumped the versao of a plano that didn't change.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 20:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('planos') as batch_op:
+        batch_op.alter_column('preco', type_=sa.Double, existing_type=sa.Float, existing_nullable=True)
+    if op.get_context().dialect.name != 'mysql':
+        return
+    # Round the widened FLOATs back to the 7 significant digits they held (see 0007)
+    op.execute("UPDATE planos SET preco = ROUND(preco, 6 - FLOOR(LOG10(preco))) WHERE preco > 0")
+
+
+def downgrade():
+    with op.batch_alter_table('planos') as batch_op:
+        batch_op.alter_column('preco', type_=sa.Float, existing_type=sa.Double, existing_nullable=True)
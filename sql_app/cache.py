@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Time to live (seconds) and maximum number of entries of the planos cache
+PLANOS_CACHE_TTL = float(os.getenv('PLANOS_CACHE_TTL', 60))
+PLANOS_CACHE_MAXSIZE = int(os.getenv('PLANOS_CACHE_MAXSIZE', 1024))
+
+# Time to live (seconds) of the /stats reports
+STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', 30))
+
+# Number of worker processes serving the app, set by gunicorn.conf.py
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+
+# Returned by the backends when the key isn't cached (None is a valid cached value)
+MISSING = object()
+
+
+class CacheBackend:
+    """Storage used by a Cache. Implement it to plug a shared cache (e.g. Redis) in place of MemoryBackend."""
+
+    # Whether every worker process sees the writes and invalidations of the others
+    shared = True
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl: float):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """In-process cache, entries expire after their TTL and the least recently used ones are evicted first."""
+
+    shared = False
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Cache:
+    """Read-through cache with hit/miss counters, on top of a pluggable backend.
+
+    A cache invalidated by the writes is bypassed when several workers run on in-process backends: a write only
+    invalidates the worker that served it, the others would keep serving the old rows until the TTL."""
+
+    def __init__(self, backend: CacheBackend, ttl: float, invalidated_by_writes: bool = False):
+        self.backend = backend
+        self.ttl = ttl
+        self.invalidated_by_writes = invalidated_by_writes
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._counters = {"hits": 0, "misses": 0, "invalidations": 0, "bypassed": 0}
+
+    @property
+    def enabled(self):
+        return not self.invalidated_by_writes or self.backend.shared or WEB_CONCURRENCY <= 1
+
+    def get_or_load(self, key, loader):
+        # Return the cached value, or load it (e.g. from the database) and cache it
+        if not self.enabled:
+            with self._lock:
+                self._counters["bypassed"] += 1
+            return loader()
+        value = self.backend.get(key)
+        with self._lock:
+            self._counters["hits" if value is not MISSING else "misses"] += 1
+        if value is MISSING:
+            generation = self._generation
+            value = loader()
+            # Don't cache a value loaded before an invalidation that happened meanwhile
+            if generation == self._generation:
+                self.backend.set(key, value, self.ttl)
+        return value
+
+    def invalidate(self):
+        # Drop every entry, called after the cached table is written
+        with self._lock:
+            self._generation += 1
+            self._counters["invalidations"] += 1
+        self.backend.clear()
+
+    def get_metrics(self):
+        with self._lock:
+            return dict(self._counters, enabled=self.enabled, size=len(self.backend), ttl=self.ttl)
+
+
+# Plans change rarely but are read constantly
+planos = Cache(MemoryBackend(PLANOS_CACHE_MAXSIZE), PLANOS_CACHE_TTL, invalidated_by_writes=True)
+
+# The reports aggregate whole tables: the short TTL bounds both how stale they get and how often they run.
+# They aren't invalidated by the writes, a dashboard can live with a report a few seconds old
+stats = Cache(MemoryBackend(64), STATS_CACHE_TTL)
+
+def set_planos_backend(backend: CacheBackend):
+    planos.backend = backend
+
+def get_metrics():
+    return {"planos": planos.get_metrics(), "stats": stats.get_metrics()}
@@ -0,0 +1,159 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+import orjson
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from . import models
+from .database import SessionLocal
+
+# Seconds the entries of the alteracoes outbox are kept (0 keeps them forever), and between two prunings
+CHANGES_RETENTION = float(os.getenv('CHANGES_RETENTION', 7 * 24 * 3600))
+CHANGES_PRUNE_INTERVAL = float(os.getenv('CHANGES_PRUNE_INTERVAL', 3600))
+# The ids are allocated when a write inserts its entries but become visible when it commits, so a newer entry can
+# show up before an older one. A gap younger than this is waited for, instead of moving the cursor past it for good.
+# Every write registers its entries in a single statement right before it commits, so the feed delivers every entry,
+# in order, as long as the commit completes within CHANGES_GAP_WAIT of that statement. The entries of a commit that
+# stalls for longer (e.g. on a lock wait or a failover) may be skipped by the readers already past them: raise it
+# above the longest commit expected, at the cost of that much delivery delay behind a rolled back write
+CHANGES_GAP_WAIT = float(os.getenv('CHANGES_GAP_WAIT', 5))
+# Seconds between the polls of the outbox by each Server-Sent Events stream, and of silence before a keepalive comment
+CHANGES_POLL_INTERVAL = float(os.getenv('CHANGES_POLL_INTERVAL', 1))
+CHANGES_KEEPALIVE = float(os.getenv('CHANGES_KEEPALIVE', 15))
+
+# Entries read per poll by the Server-Sent Events streams, and deleted per statement when pruning
+STREAM_LIMIT = 1000
+PRUNE_CHUNK_SIZE = 10000
+
+# Tables and operations of the entries
+MEMBROS = models.MembrosSQL.__tablename__
+PLANOS = models.PlanosSQL.__tablename__
+MEMBRO_PLANO = models.membro_plano_association.name
+CRIACAO = "criacao"
+ALTERACAO = "alteracao"
+REMOCAO = "remocao"
+
+# Columns never published in the feed
+PRIVATE_COLUMNS = ("hashed_password",)
+
+logger = logging.getLogger("sql_app.changes")
+
+
+# ==== WRITES ====
+
+def alteracao(tabela: str, operacao: str, id_membro: int = None, id_plano: int = None, dados: dict = None):
+    # Row of the outbox, dados has the new values of the columns that were written
+    if dados is not None:
+        dados = orjson.dumps({coluna: valor for coluna, valor in dados.items() if coluna not in PRIVATE_COLUMNS}).decode()
+    return {"tabela": tabela, "operacao": operacao, "id_membro": id_membro, "id_plano": id_plano, "dados": dados}
+
+def _carimbadas(alteracoes: list):
+    # criado_em is when the ids are taken, which the gap wait counts from
+    agora = datetime.now()
+    return [dict(alteracao, criado_em=agora) for alteracao in alteracoes]
+
+def registrar(db: Session, alteracoes: list):
+    # Append to the outbox in the transaction of the write. Called once per transaction, right before the caller
+    # commits it, so the ids are taken as late as possible (see CHANGES_GAP_WAIT)
+    if alteracoes:
+        db.execute(insert(models.AlteracoesSQL), _carimbadas(alteracoes))
+
+async def registrar_async(db: AsyncSession, alteracoes: list):
+    if alteracoes:
+        await db.execute(insert(models.AlteracoesSQL), _carimbadas(alteracoes))
+
+
+# ==== READS ====
+
+def _listagem(since: int, limit: int):
+    return select(models.AlteracoesSQL).where(models.AlteracoesSQL.id > since).order_by(models.AlteracoesSQL.id).limit(limit)
+
+def _entregaveis(alteracoes: list, since: int):
+    # The entries up to the first gap that may still be filled by a write yet to commit
+    agora = datetime.now()
+    anterior = since
+    for posicao, alteracao in enumerate(alteracoes):
+        if alteracao.id != anterior + 1 and (agora - alteracao.criado_em).total_seconds() < CHANGES_GAP_WAIT:
+            return alteracoes[:posicao]
+        anterior = alteracao.id
+    return alteracoes
+
+def _check_expirado(since: int, mais_antigo: int):
+    # Raise an HTTPException with a 410 status code if entries after the cursor were already pruned
+    if since > 0 and mais_antigo is not None and since + 1 < mais_antigo:
+        raise HTTPException(status_code=410, detail="Error - cursor expirado, refaça a listagem completa")
+
+def get_changes(db: Session, since: int = 0, limit: int = 100):
+    alteracoes = db.scalars(_listagem(since, limit)).all()
+    # Only look for the oldest entry when the page doesn't start right after the cursor
+    if not alteracoes or alteracoes[0].id != since + 1:
+        _check_expirado(since, db.scalar(select(func.min(models.AlteracoesSQL.id))))
+    return _entregaveis(alteracoes, since)
+
+async def get_changes_async(db: AsyncSession, since: int = 0, limit: int = 100):
+    alteracoes = (await db.scalars(_listagem(since, limit))).all()
+    if not alteracoes or alteracoes[0].id != since + 1:
+        _check_expirado(since, await db.scalar(select(func.min(models.AlteracoesSQL.id))))
+    return _entregaveis(alteracoes, since)
+
+
+# ==== SERVER-SENT EVENTS ====
+
+def sse_event(alteracao):
+    # Server-Sent Event of one entry, its id is the cursor the client resumes from (Last-Event-ID) when it reconnects
+    return f"id: {alteracao.id}\nevent: alteracao\ndata: {alteracao.model_dump_json()}\n\n"
+
+def sse_since(since: int, last_event_id: str):
+    # A reconnecting EventSource sends the id of the last event it got, which takes precedence over since
+    if last_event_id is not None and last_event_id.strip().isdigit():
+        return int(last_event_id)
+    return since
+
+
+# ==== PRUNING ====
+
+def prune(db: Session):
+    # Delete the entries older than the retention, in chunks of ids so no statement locks the whole table
+    limite = db.scalar(select(func.max(models.AlteracoesSQL.id)).where(models.AlteracoesSQL.criado_em < datetime.now() - timedelta(seconds=CHANGES_RETENTION)))
+    if limite is None:
+        return 0
+    removidas = 0
+    inicio = db.scalar(select(func.min(models.AlteracoesSQL.id)))
+    while inicio <= limite:
+        fim = min(inicio + PRUNE_CHUNK_SIZE - 1, limite)
+        removidas += db.execute(delete(models.AlteracoesSQL).where(models.AlteracoesSQL.id.between(inicio, fim))).rowcount
+        db.commit()
+        inicio = fim + 1
+    return removidas
+
+_stop = threading.Event()
+_pruner = None
+
+def _prune_loop():
+    while not _stop.is_set():
+        try:
+            with SessionLocal() as db:
+                prune(db)
+        except Exception:
+            # Try again at the next interval, the table only grows meanwhile
+            logger.exception("failed to prune the alteracoes outbox")
+        _stop.wait(CHANGES_PRUNE_INTERVAL)
+
+def start_pruner():
+    # Prune the outbox in a background thread, unless the entries are kept forever
+    global _pruner
+    if CHANGES_RETENTION <= 0 or _pruner is not None:
+        return
+    _stop.clear()
+    _pruner = threading.Thread(target=_prune_loop, name="changes-pruner", daemon=True)
+    _pruner.start()
+
+def stop_pruner():
+    global _pruner
+    if _pruner is not None:
+        _stop.set()
+        _pruner.join()
+        _pruner = None
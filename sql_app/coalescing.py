@@ -0,0 +1,119 @@
+import asyncio
+import os
+import threading
+from . import etags
+
+# Seconds a request waits for the identical query already in flight before running its own (0 disables the coalescing)
+COALESCING_MAX_WAIT = float(os.getenv('COALESCING_MAX_WAIT', 1.0))
+
+
+class _Flight:
+    """One in-flight load, with the result or the error shared by the requests that joined it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Concurrent identical reads share a single load: the first request runs it, the others wait for its result.
+
+    The key carries the versions of the tables read (see etags), and a write bumps them after its commit, so a
+    request that arrives after a write starts a new load instead of joining one that may have read the old data.
+    The versions are per process unless a shared etags backend is set, like the flights themselves."""
+
+    def __init__(self, max_wait: float):
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._async_flights = {}
+        self._routes = {}
+
+    def _key(self, key: tuple, tables: tuple):
+        return (*key, *(etags.backend.get(table) for table in tables))
+
+    def _record(self, route: str, outcome: str):
+        with self._lock:
+            counters = self._routes.setdefault(route, {"loads": 0, "coalesced": 0, "timeouts": 0})
+            counters[outcome] += 1
+
+    def run(self, key: tuple, tables: tuple, load):
+        # For the threadpool routes. key starts with the route, followed by the parameters
+        if self.max_wait <= 0:
+            return load()
+        key = self._key(key, tables)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if leader:
+            self._record(key[0], "loads")
+            try:
+                flight.result = load()
+            except Exception as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+            return flight.result
+
+        # Past the max wait, stop waiting for a slow load and run our own
+        if not flight.done.wait(self.max_wait):
+            self._record(key[0], "timeouts")
+            return load()
+        self._record(key[0], "coalesced")
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    async def run_async(self, key: tuple, tables: tuple, load):
+        # For the coroutine routes of sql_app.main_async, load is a coroutine function. The flights live on the event loop
+        if self.max_wait <= 0:
+            return await load()
+        key = self._key(key, tables)
+        flight = self._async_flights.get(key)
+
+        if flight is None:
+            self._record(key[0], "loads")
+            flight = self._async_flights[key] = asyncio.get_running_loop().create_future()
+            try:
+                result = await load()
+            except asyncio.CancelledError:
+                # A cancelled leader cancels the flight, and the requests waiting on it run their own load
+                flight.cancel()
+                raise
+            except Exception as e:
+                flight.set_exception(e)
+                # Retrieved here, so a flight nobody joined doesn't log "exception was never retrieved"
+                flight.exception()
+                raise
+            else:
+                flight.set_result(result)
+            finally:
+                del self._async_flights[key]
+            return result
+
+        # Past the max wait, or if the leader was cancelled, run our own load. asyncio.wait never cancels the flight
+        await asyncio.wait((flight,), timeout=self.max_wait)
+        if not flight.done() or flight.cancelled():
+            self._record(key[0], "timeouts")
+            return await load()
+        self._record(key[0], "coalesced")
+        return flight.result()
+
+    def get_metrics(self):
+        with self._lock:
+            routes = {route: dict(counters) for route, counters in self._routes.items()}
+            in_flight = len(self._flights) + len(self._async_flights)
+        return {"max_wait": self.max_wait, "in_flight": in_flight, "routes": routes}
+
+
+flights = SingleFlight(COALESCING_MAX_WAIT)
+
+def get_metrics():
+    return flights.get_metrics()
@@ -1,14 +1,118 @@
-import bcrypt
-from sqlalchemy.orm import Session
-from . import models, schemas
+import base64
+import binascii
+import json
+from datetime import datetime
+from pydantic import ValidationError
+from sqlalchemy import LargeBinary, String, and_, cast, delete, insert, literal, or_, select, tuple_, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import Session, load_only, selectinload
+from . import cache, changes, etags, hashing, models, schemas
 from fastapi import HTTPException
 
 
+# Maximum number of values bound in a single IN (...) clause
+IN_CHUNK_SIZE = 1000
+
+def _chunks(values: list, size: int = IN_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+# Columns GET /membros can be sorted by ("-" in front for descending order), the id breaks the ties
+MEMBROS_SORT_KEYS = {
+    "id_membro": models.MembrosSQL.id_membro,
+    "nome_membro": models.MembrosSQL.nome_membro,
+    "peso": models.MembrosSQL.peso,
+    "data_inscricao_academia": models.MembrosSQL.data_inscricao_academia,
+    "data_nascimento": models.MembrosSQL.data_nascimento,
+}
+
+# Columns GET /membros can project with fields=, hashed_password is never one of them
+MEMBROS_FIELDS = tuple(schemas.MembroBase.model_fields)
+
+# ==== PAGINATION ====
+
+def encode_cursor(last_id: int, sort: str = None, sort_value = None):
+    # The cursor is the last id returned (plus the sort and its column's value, when sorted by another column), wrapped in an opaque token
+    payload = {"id": last_id}
+    if sort is not None:
+        payload.update(sort=sort, valor=sort_value.isoformat() if isinstance(sort_value, datetime) else sort_value)
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf8')).decode('ascii')
+
+def _decode_payload(cursor: str):
+    # Raise an HTTPException with a 400 status code if the cursor wasn't generated by encode_cursor
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        last_id = payload["id"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Error - cursor inválido")
+    if not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Error - cursor inválido")
+    return payload
+
+def decode_cursor(cursor: str):
+    # Return the last id returned in the previous page
+    return _decode_payload(cursor)["id"]
+
+def parse_membros_sort(sort: str):
+    # "peso" sorts by ascending weight, "-peso" by descending weight
+    column = MEMBROS_SORT_KEYS.get(sort.removeprefix("-"))
+    if column is None:
+        raise HTTPException(status_code=400, detail=f"Error - ordenação inválida, use um de: {', '.join(MEMBROS_SORT_KEYS)}")
+    return column, sort.startswith("-")
+
+def parse_membros_fields(fields: str):
+    # "nome_membro,peso" -> the projected columns, in the schema's order
+    nomes = {nome.strip() for nome in fields.split(",") if nome.strip()}
+    invalidos = nomes.difference(MEMBROS_FIELDS)
+    if not nomes:
+        raise HTTPException(status_code=400, detail=f"Error - nenhum campo informado, use um ou mais de: {', '.join(MEMBROS_FIELDS)}")
+    if invalidos:
+        raise HTTPException(status_code=400, detail=f"Error - campos inválidos ({', '.join(sorted(invalidos))}), use um ou mais de: {', '.join(MEMBROS_FIELDS)}")
+    return tuple(nome for nome in MEMBROS_FIELDS if nome in nomes)
+
+def encode_membros_cursor(last_membro: models.MembrosSQL, sort: str = "id_membro"):
+    # Cursor of the page ending at last_membro, sorted by sort
+    column, _ = parse_membros_sort(sort)
+    if column is models.MembrosSQL.id_membro:
+        return encode_cursor(last_membro.id_membro)
+    return encode_cursor(last_membro.id_membro, sort, getattr(last_membro, column.key))
+
+def _membros_keyset(last_membro: models.MembrosSQL, sort: str = "id_membro"):
+    # Keyset (sort column value, id) of last_membro, the same decode_membros_cursor returns for its cursor
+    column, _ = parse_membros_sort(sort)
+    if column is models.MembrosSQL.id_membro:
+        return (last_membro.id_membro,)
+    return (getattr(last_membro, column.key), last_membro.id_membro)
+
+def decode_membros_cursor(cursor: str, sort: str = "id_membro"):
+    # Return the keyset (sort column value, id) after which the page starts; the cursor must come from a page with the same sort
+    payload = _decode_payload(cursor)
+    column, _ = parse_membros_sort(sort)
+    if column is models.MembrosSQL.id_membro:
+        if "sort" in payload:
+            raise HTTPException(status_code=400, detail="Error - cursor inválido para essa ordenação")
+        return (payload["id"],)
+    if payload.get("sort") != sort:
+        raise HTTPException(status_code=400, detail="Error - cursor inválido para essa ordenação")
+    try:
+        valor = datetime.fromisoformat(payload["valor"]) if column.type.python_type is datetime else column.type.python_type(payload["valor"])
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Error - cursor inválido")
+    return (valor, payload["id"])
+
 # ==== GET ====
 
-def get_membro(db: Session, membro_id: int, modo_criar = False):
+def _membros_query(db: Session, include_planos: bool = False):
+    # With include_planos, the planos of all the membros returned are loaded with one extra query (SELECT ... IN)
+    query = db.query(models.MembrosSQL)
+    if include_planos:
+        query = query.options(selectinload(models.MembrosSQL.planos))
+    return query
+
+def get_membro(db: Session, membro_id: int, modo_criar = False, include_planos: bool = False):
     # First, check if the member exists
-    existing_membro = db.query(models.MembrosSQL).filter(models.MembrosSQL.id_membro == membro_id).first()
+    existing_membro = _membros_query(db, include_planos).filter(models.MembrosSQL.id_membro == membro_id).first()
 
     # Raise an HTTPException with a 400 status code if the member doesn't exist
     if not existing_membro and not modo_criar:
@@ -17,8 +121,80 @@ def get_membro(db: Session, membro_id: int, modo_criar = False):
     # Return the member
     return existing_membro
 
-def get_all_membros(db: Session):
-    return db.query(models.MembrosSQL).all()
+def _membros_filtros(filtros: schemas.MembrosFiltro):
+    # WHERE conditions of the filters that were informed
+    membro = models.MembrosSQL
+    condicoes = []
+    if filtros.nome is not None:
+        # LIKE 'prefix%', with the wildcards of the prefix escaped, can use the nome_membro index
+        condicoes.append(membro.nome_membro.startswith(filtros.nome, autoescape=True))
+    if filtros.sexo is not None:
+        condicoes.append(membro.sexo == filtros.sexo)
+    for column, minimo, maximo in (
+        (membro.data_inscricao_academia, filtros.inscricao_de, filtros.inscricao_ate),
+        (membro.data_nascimento, filtros.nascimento_de, filtros.nascimento_ate),
+        (membro.peso, filtros.peso_min, filtros.peso_max),
+    ):
+        if minimo is not None:
+            condicoes.append(column >= minimo)
+        if maximo is not None:
+            condicoes.append(column <= maximo)
+    return condicoes
+
+def _membros_listing(after: tuple = None, include_planos: bool = False, filtros: schemas.MembrosFiltro = None,
+                     sort: str = "id_membro", fields: tuple = None):
+    # Single SELECT with the filters, the keyset and the projection, served by the (sort column, id) indexes
+    column, descending = parse_membros_sort(sort)
+    membro = models.MembrosSQL
+    keyset = [membro.id_membro] if column is membro.id_membro else [column, membro.id_membro]
+
+    query = select(membro).order_by(*(key.desc() if descending else key for key in keyset))
+    if include_planos:
+        query = query.options(selectinload(membro.planos))
+    if fields is not None:
+        # Only the projected columns (plus the keyset, for the next cursor) are selected
+        query = query.options(load_only(*(getattr(membro, name) for name in dict.fromkeys([*fields, *(key.key for key in keyset)]))))
+    if filtros is not None:
+        query = query.where(*_membros_filtros(filtros))
+
+    # The page starts right after the cursor: (column, id) > (value, last id), spelled out so MySQL uses a range scan
+    if after is not None:
+        if len(keyset) == 1:
+            query = query.where(membro.id_membro < after[0] if descending else membro.id_membro > after[0])
+        else:
+            valor, last_id = after
+            if descending:
+                query = query.where(column <= valor, or_(column < valor, and_(column == valor, membro.id_membro < last_id)))
+            else:
+                query = query.where(column >= valor, or_(column > valor, and_(column == valor, membro.id_membro > last_id)))
+    return query
+
+def get_all_membros(db: Session, limit: int = None, after: tuple = None, include_planos: bool = False,
+                    filtros: schemas.MembrosFiltro = None, sort: str = "id_membro", fields: tuple = None):
+    # Keyset pagination: the membros are ordered by the sort column and the id, and the page starts right after the cursor
+    query = _membros_listing(after, include_planos, filtros, sort, fields)
+    if limit is not None:
+        query = query.limit(limit)
+    return db.scalars(query).all()
+
+def iter_membros(db: Session, after: tuple = None, chunk_size: int = 1000, include_planos: bool = False,
+                 filtros: schemas.MembrosFiltro = None, sort: str = "id_membro", fields: tuple = None):
+    # Stream the membros from the database in chunks, without loading the whole table at once
+    if include_planos:
+        # selectinload can't run its SELECT ... IN on the connection still reading an unbuffered cursor (yield_per),
+        # pymysql would end the stream after the first chunk: read one keyset page per chunk instead
+        while True:
+            chunk = get_all_membros(db, chunk_size, after, include_planos, filtros, sort, fields)
+            if not chunk:
+                return
+            after = _membros_keyset(chunk[-1], sort)
+            yield chunk
+            # The chunk was already serialized, don't keep it in the session
+            db.expunge_all()
+            if len(chunk) < chunk_size:
+                return
+    query = _membros_listing(after, include_planos, filtros, sort, fields)
+    yield from db.scalars(query.execution_options(yield_per=chunk_size)).partitions()
 
 def get_plano(db: Session, plano_id: int, modo_criar = False):
     # First, check if the plan exists
@@ -31,36 +207,54 @@ def get_plano(db: Session, plano_id: int, modo_criar = False):
     # Return the plan
     return existing_plano
 
-def get_all_planos(db: Session):
-    return db.query(models.PlanosSQL).all()
-
-def get_membros_ativos(db: Session):
-    # First, get all the membros in the database
-    all_membros = db.query(models.MembrosSQL).all()
-
-    # Iterate through each membro and get all his planos
-    for membro in all_membros:
-        is_membro_active = False
-        ids_planos = [plano.id_plano for plano in membro.planos]
-        
-        # If the membro has at least one plano that is active, then he is active
-        for id_plano in ids_planos:
-            if get_plano(db, id_plano).ativo:
-                is_membro_active = True
-                break
-        
-        # If the membro is not active, remove him from the list
-        if not is_membro_active:
-            all_membros.remove(membro)
+def get_plano_cached(db: Session, plano_id: int):
+    # Read-through the planos cache, only the database hit raises if the plan doesn't exist
+    return cache.planos.get_or_load(("plano", plano_id), lambda: schemas.Plano.model_validate(get_plano(db, plano_id)))
+
+def get_all_planos(db: Session, limit: int = None, after: int = None):
+    # Keyset pagination: the planos are ordered by id and the page starts right after the cursor
+    query = db.query(models.PlanosSQL).order_by(models.PlanosSQL.id_plano)
+    if after is not None:
+        query = query.filter(models.PlanosSQL.id_plano > after)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+def get_all_planos_cached(db: Session, limit: int = None, after: int = None):
+    # Read-through the planos cache, each page is cached under its own key
+    return cache.planos.get_or_load(
+        ("planos", limit, after),
+        lambda: [schemas.Plano.model_validate(plano) for plano in get_all_planos(db, limit, after)],
+    )
+
+def iter_planos(db: Session, after: int = None, chunk_size: int = 1000):
+    # Stream the planos from the database in chunks, without loading the whole table at once
+    query = select(models.PlanosSQL).order_by(models.PlanosSQL.id_plano)
+    if after is not None:
+        query = query.where(models.PlanosSQL.id_plano > after)
+    yield from db.scalars(query.execution_options(yield_per=chunk_size)).partitions()
+
+def get_membros_ativos(db: Session, include_planos: bool = False):
+    # Subquery that checks, through the association table, if the membro has at least one active plano
+    has_plano_ativo = (
+        select(models.membro_plano_association.c.membro_id)
+        .join(models.PlanosSQL, models.PlanosSQL.id_plano == models.membro_plano_association.c.plano_id)
+        .where(models.membro_plano_association.c.membro_id == models.MembrosSQL.id_membro)
+        .where(models.PlanosSQL.ativo == True)
+        .exists()
+    )
+
+    # Get all the active membros with a single query
+    membros_ativos = _membros_query(db, include_planos).filter(has_plano_ativo).order_by(models.MembrosSQL.id_membro).all()
 
     # Raise an HTTPException with a 400 status code if there are no active membros
-    if not all_membros:
+    if not membros_ativos:
         raise HTTPException(status_code=400, detail="Error - nenhum membro com plano ativo")
 
     # Return the list of active membros
-    return all_membros
+    return membros_ativos
 
-def get_membros_plano(db: Session, plano_id: int):
+def get_membros_plano(db: Session, plano_id: int, include_planos: bool = False):
     # First, check if the plan exists
     existing_plano = get_plano(db, plano_id)
 
@@ -68,26 +262,21 @@ def get_membros_plano(db: Session, plano_id: int):
     if not existing_plano:
         raise HTTPException(status_code=400, detail="Error - plano não existe")
     
-    # Get all the membros in the database
-    all_membros = db.query(models.MembrosSQL).all()
-
-    # Iterate through each membro and get all his planos
-    for membro in all_membros:
-        ids_planos = [plano.id_plano for plano in membro.planos]
-        
-        # If the membro has the plano, add him to the list
-        if plano_id in ids_planos:
-            continue
-        else:
-            all_membros.remove(membro)
+    # Get the membros with the plan by joining with the association table
+    membros_plano = (
+        _membros_query(db, include_planos)
+        .join(models.membro_plano_association, models.membro_plano_association.c.membro_id == models.MembrosSQL.id_membro)
+        .filter(models.membro_plano_association.c.plano_id == plano_id)
+        .order_by(models.MembrosSQL.id_membro)
+        .all()
+    )
 
     # Raise an HTTPException with a 400 status code if there are no membros with the plan
-    if not all_membros:
+    if not membros_plano:
         raise HTTPException(status_code=400, detail="Error - nenhum membro com esse plano")
 
     # Return the list of membros with the plan
-    return all_membros
-        
+    return membros_plano
 
 def get_planos_membro(db: Session, membro_id: int):
     # First, check if the member exists
@@ -97,114 +286,233 @@ def get_planos_membro(db: Session, membro_id: int):
     if not existing_membro:
         raise HTTPException(status_code=400, detail="Error - membro não existe")
 
+    # Get the member's planos by joining with the association table
+    planos_membro = (
+        db.query(models.PlanosSQL)
+        .join(models.membro_plano_association, models.membro_plano_association.c.plano_id == models.PlanosSQL.id_plano)
+        .filter(models.membro_plano_association.c.membro_id == membro_id)
+        .order_by(models.PlanosSQL.id_plano)
+        .all()
+    )
+
     # Return the member's planos
-    return existing_membro.planos
+    return planos_membro
 
 # ==== POST ====
 
-def create_membro(db: Session, membro: schemas.MembroCreate):
-    # First, check if the member already exists
-    existing_membro = get_membro(db, membro.id_membro, modo_criar=True)
-    
-    # Raise an HTTPException with a 400 status code if the member already exists
-    if existing_membro:
-        raise HTTPException(status_code=400, detail="Error - membro já existe")    
-    
-    # Create a SQLAlchemy model instance of the member
-    db_membro = models.MembrosSQL(
-        nome_membro=membro.nome_membro,
-        peso=membro.peso,
-        sexo=membro.sexo,
-        data_inscricao_plano_atual=membro.data_inscricao_plano_atual,
-        data_inscricao_academia=membro.data_inscricao_academia,
-        data_nascimento=membro.data_nascimento,
-        rg=membro.rg,
-        hashed_password=bcrypt.hashpw(f'{membro.password}'.encode('utf8'), bcrypt.gensalt(rounds=10)) # hash the password with bcrypt
-    )
-    
-    # Add the member to the database
-    db.add(db_membro)
-    db.commit()
-    db.refresh(db_membro)
-    return db_membro
+def is_duplicate_key(error: IntegrityError):
+    # MySQL reports a duplicated primary key as ER_DUP_ENTRY (1062), SQLite as "UNIQUE constraint failed"
+    args = getattr(error.orig, "args", ())
+    return (bool(args) and args[0] == 1062) or "UNIQUE constraint failed" in str(error.orig)
+
+def create_membro(db: Session, membro: schemas.MembroCreate, hashed_password: str = None):
+    # Create the row of the member, with its password hashed with bcrypt in the hashing worker pool (unless the caller
+    # already awaited the hash, without holding a thread meanwhile)
+    if hashed_password is None:
+        hashed_password = hashing.hash_password(f'{membro.password}')
+    db_membro = dict(membro.model_dump(exclude={"password"}), hashed_password=hashed_password)
+
+    # Insert the member straight away, the primary key rejects an existing id, and log it in the outbox
+    try:
+        db.execute(insert(models.MembrosSQL), [db_membro])
+        changes.registrar(db, [changes.alteracao(changes.MEMBROS, changes.CRIACAO, id_membro=membro.id_membro, dados=dict(db_membro, versao=1))])
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        # Raise an HTTPException with a 400 status code if the member already exists
+        if is_duplicate_key(e):
+            raise HTTPException(status_code=400, detail="Error - membro já existe")
+        raise
+    etags.bump(etags.MEMBROS)
+
+    # The row is exactly what was inserted (its dates as the columns store them, see schemas.MembroCreate), at its first
+    # version, no need to read it back
+    return dict(db_membro, versao=1)
 
 def create_plano(db: Session, plano: schemas.PlanoCreate):
-    # First, check if the plan already exists
-    existing_plano = get_plano(db, plano.id_plano, modo_criar=True)
+    # Create the row of the plan
+    db_plano = plano.model_dump()
 
-    # Raise an HTTPException with a 400 status code if the plan already exists
-    if existing_plano:
-        raise HTTPException(status_code=400, detail="Error - plano já existe")
-    
-    # Create a SQLAlchemy model instance of the plan
-    db_plano = models.PlanosSQL(
-        nome_plano=plano.nome_plano,
-        preco=plano.preco,
-        multa_valor_fidelidade=plano.multa_valor_fidelidade,
-        tempo_fidelidade=plano.tempo_fidelidade,
-        tempo_duracao=plano.tempo_duracao,
-        beneficios=plano.beneficios,
-        ativo=plano.ativo,
-    )
+    # Insert the plan straight away, the primary key rejects an existing id, and log it in the outbox
+    try:
+        db.execute(insert(models.PlanosSQL), [db_plano])
+        changes.registrar(db, [changes.alteracao(changes.PLANOS, changes.CRIACAO, id_plano=plano.id_plano, dados=dict(db_plano, versao=1))])
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        # Raise an HTTPException with a 400 status code if the plan already exists
+        if is_duplicate_key(e):
+            raise HTTPException(status_code=400, detail="Error - plano já existe")
+        raise
+    cache.planos.invalidate()
+    etags.bump(etags.PLANOS)
+
+    # The row is exactly what was inserted, at its first version, no need to read it back
+    return dict(db_plano, versao=1)
+
+def _bulk_insert(db: Session, model, id_column, nome: str, linhas: list, schema, build_rows):
+    # Validate the rows of one chunk, then insert the valid ones with a single executemany in one transaction
+    erros = []
+    validos = []
+    ids_vistos = set()
+    for linha, dados in linhas:
+        # Validate the row with the same schema as the single-row endpoint
+        try:
+            obj = schema.model_validate(dados)
+        except ValidationError as e:
+            campos = "; ".join(f"{'.'.join(str(loc) for loc in erro['loc'])}: {erro['msg']}" if erro['loc'] else erro['msg'] for erro in e.errors())
+            dados_id = dados.get(id_column.key) if isinstance(dados, dict) else None
+            erros.append({"linha": linha, "id": dados_id if isinstance(dados_id, int) else None, "detail": f"Error - dados inválidos ({campos})"})
+            continue
 
-    # Add the plan to the database
-    db.add(db_plano)
+        # The same id twice in the payload, only the first one is inserted
+        obj_id = getattr(obj, id_column.key)
+        if obj_id in ids_vistos:
+            erros.append({"linha": linha, "id": obj_id, "detail": f"Error - {nome} repetido no lote"})
+            continue
+        ids_vistos.add(obj_id)
+        validos.append((linha, obj))
+
+    # Check which ids already exist with a single query
+    ids_existentes = set(db.scalars(select(id_column).where(id_column.in_(ids_vistos)))) if ids_vistos else set()
+    for linha, obj in validos:
+        if getattr(obj, id_column.key) in ids_existentes:
+            erros.append({"linha": linha, "id": getattr(obj, id_column.key), "detail": f"Error - {nome} já existe"})
+    validos = [(linha, obj) for linha, obj in validos if getattr(obj, id_column.key) not in ids_existentes]
+    if not validos:
+        return 0, erros
+
+    # Insert the whole chunk at once, with its entries in the outbox
+    rows = build_rows([obj for _, obj in validos])
+    alteracoes = [changes.alteracao(model.__tablename__, changes.CRIACAO, dados=dict(row, versao=1), **{id_column.key: row[id_column.key]}) for row in rows]
+    try:
+        db.execute(insert(model), rows)
+        changes.registrar(db, alteracoes)
+        db.commit()
+        return len(rows), erros
+    except DBAPIError:
+        # Not only IntegrityError: MySQL reports a CHECK violation as OperationalError and a too long value as DataError
+        db.rollback()
+
+    # Some row broke a constraint (or was inserted concurrently): retry one by one, each in a savepoint, to report it
+    registradas = []
+    for (linha, obj), row, alteracao in zip(validos, rows, alteracoes):
+        try:
+            with db.begin_nested():
+                db.execute(insert(model), [row])
+            registradas.append(alteracao)
+        except DBAPIError as e:
+            erros.append({"linha": linha, "id": getattr(obj, id_column.key), "detail": f"Error - {nome} inválido ({e.orig})"})
+
+    # Log the rows that were inserted in the outbox, all at once right before the commit
+    changes.registrar(db, registradas)
     db.commit()
-    db.refresh(db_plano)
-    return db_plano
+    return len(registradas), erros
+
+def create_membros_bulk(db: Session, linhas: list):
+    # linhas is a list of (line number, raw json object) tuples
+    def build_rows(membros: list[schemas.MembroCreate]):
+        # Hash all the passwords of the chunk in parallel, in the hashing worker pool
+        hashed_passwords = hashing.hash_passwords([f'{membro.password}' for membro in membros])
+        return [
+            dict(membro.model_dump(exclude={"password"}), hashed_password=hashed_password)
+            for membro, hashed_password in zip(membros, hashed_passwords)
+        ]
+
+    inseridos, erros = _bulk_insert(db, models.MembrosSQL, models.MembrosSQL.id_membro, "membro", linhas, schemas.MembroCreate, build_rows)
+    if inseridos:
+        etags.bump(etags.MEMBROS)
+    return inseridos, erros
+
+def create_planos_bulk(db: Session, linhas: list):
+    # linhas is a list of (line number, raw json object) tuples
+    def build_rows(planos: list[schemas.PlanoCreate]):
+        return [plano.model_dump() for plano in planos]
+
+    inseridos, erros = _bulk_insert(db, models.PlanosSQL, models.PlanosSQL.id_plano, "plano", linhas, schemas.PlanoCreate, build_rows)
+    if inseridos:
+        cache.planos.invalidate()
+        etags.bump(etags.PLANOS)
+    return inseridos, erros
 
 # ==== UPDATE ====
 
-def update_membro(db: Session, membro: schemas.MembroCreate, membro_id: int):
-    # First, check if the member with the specified ID exists
-    existing_membro = get_membro(db, membro_id)
-
-    if existing_membro:
-        # Update the member attributes with the new values
-        existing_membro.nome_membro = membro.nome_membro
-        existing_membro.peso = membro.peso
-        existing_membro.sexo = membro.sexo
-        existing_membro.data_inscricao_plano_atual = membro.data_inscricao_plano_atual
-        existing_membro.data_inscricao_academia = membro.data_inscricao_academia
-        existing_membro.data_nascimento = membro.data_nascimento
-        existing_membro.rg = membro.rg
-        existing_membro.hashed_password = bcrypt.hashpw(f'{membro.hashed_password}'.encode('utf8'), bcrypt.gensalt(rounds=10))
-
-        # Commit the changes to the database
-        db.commit()
-
-        # Refresh the instance to get the updated state from the database
-        db.refresh(existing_membro)
+def _valor_diferente(dialect, column, valor):
+    # IS DISTINCT FROM, which compares NULLs too. MySQL compares strings with the column's collation, which ignores
+    # case and trailing spaces: a change of case would look like no change, so their bytes are compared instead
+    if dialect.name == "mysql" and isinstance(column.type, String):
+        return cast(column, LargeBinary).is_distinct_from(cast(literal(valor, column.type), LargeBinary))
+    return column.is_distinct_from(valor)
+
+def _update_versionado(db: Session, model, id_column, row_id: int, valores: dict, if_match: int, nome: str):
+    # UPDATE only the columns that were sent and bump the versao. With If-Match the version check is part of the
+    # WHERE, so a concurrent write can't slip in between a read and the write.
+    # Return the row and whether it changed: resending the current values is a no-op, without a new versao
+    condicoes = [id_column == row_id]
+    if if_match is not None:
+        condicoes.append(model.versao == if_match)
+
+    row = None
+    if valores:
+        # Only when some value differs from the current one. The values are compared as the columns store them:
+        # the schemas already dropped what a DATETIME can't keep, and the floats are DOUBLE
+        dialect = db.get_bind().dialect
+        diferente = or_(*(_valor_diferente(dialect, getattr(model, coluna), valor) for coluna, valor in valores.items()))
+        stmt = update(model).where(*condicoes, diferente).values(**valores, versao=model.versao + 1)
+        # No objects of the session to keep in sync, which would cost a SELECT before the UPDATE without RETURNING
+        stmt = stmt.execution_options(synchronize_session=False)
+        if db.get_bind().dialect.update_returning:
+            # Get the updated row back in the same statement
+            row = db.execute(stmt.returning(*model.__table__.c)).mappings().first()
+        elif db.execute(stmt).rowcount:
+            # The rowcount counts the matched rows, even when the values didn't change (SQLAlchemy connects to MySQL
+            # with the CLIENT_FOUND_ROWS flag), but the WHERE above only matches a row that changes
+            row = db.execute(select(*model.__table__.c).where(id_column == row_id)).mappings().first()
+    alterado = row is not None
+
+    if row is None:
+        # Nothing to change, just check the conditions
+        row = db.execute(select(*model.__table__.c).where(*condicoes)).mappings().first()
+
+    if row is None:
+        db.rollback()
+        # Tell apart a missing row from a version conflict, only when the update didn't go through
+        versao = db.scalar(select(model.versao).where(id_column == row_id))
+        # Raise an HTTPException with a 400 status code if the row doesn't exist
+        if versao is None:
+            raise HTTPException(status_code=400, detail=f'Error - {nome} não existe')
+        # And with a 412 status code if someone else changed it since the version the client sent
+        raise HTTPException(status_code=412, detail=f'Error - {nome} foi alterado, versão atual {versao}',
+                            headers={"ETag": etags.row_etag(versao)})
+
+    # Log the columns that were written in the outbox, then commit the changes to the database
+    if alterado:
+        changes.registrar(db, [changes.alteracao(model.__tablename__, changes.ALTERACAO, dados=dict(valores, versao=row["versao"]), **{id_column.key: row_id})])
+    db.commit()
+    return dict(row), alterado
 
-        return existing_membro
+def update_membro(db: Session, membro: schemas.MembroUpdate, membro_id: int, if_match: int = None, hashed_password: str = None):
+    # Only the fields that were sent are updated
+    valores = membro.model_dump(exclude_unset=True, exclude={"id_membro", "password"})
 
-    # Raise an HTTPException with a 400 status code if the member doesn't exist
-    raise HTTPException(status_code=400, detail=f'Error - membro não existe')
+    # Hash the password only when a new one is sent, unless the caller already hashed it
+    if membro.password is not None:
+        valores["hashed_password"] = hashed_password or hashing.hash_password(f'{membro.password}')
 
-def update_plano(db: Session, plano: schemas.PlanoCreate, plano_id: int):
-    # First, check if the plano with the specified ID exists
-    existing_plano = get_plano(db, plano_id)
-    
-    if existing_plano:
-        # Update the member attributes with the new values
-        existing_plano.nome_plano = plano.nome_plano
-        existing_plano.preco = plano.preco
-        existing_plano.multa_valor_fidelidade = plano.multa_valor_fidelidade
-        existing_plano.tempo_fidelidade = plano.tempo_fidelidade
-        existing_plano.tempo_duracao = plano.tempo_duracao
-        existing_plano.beneficios = plano.beneficios
-        existing_plano.ativo = plano.ativo
-
-        # Commit the changes to the database
-        db.commit()
-
-        # Refresh the instance to get the updated state from the database
-        db.refresh(existing_plano)
+    db_membro, alterado = _update_versionado(db, models.MembrosSQL, models.MembrosSQL.id_membro, membro_id, valores, if_match, "membro")
+    if alterado:
+        etags.bump(etags.MEMBROS)
+    return db_membro
 
-        return existing_plano
+def update_plano(db: Session, plano: schemas.PlanoUpdate, plano_id: int, if_match: int = None):
+    # Only the fields that were sent are updated
+    valores = plano.model_dump(exclude_unset=True, exclude={"id_plano"})
 
-    # Raise an HTTPException with a 400 status code if the plano doesn't exist
-    raise HTTPException(status_code=400, detail=f'Error - plano não existe')
+    db_plano, alterado = _update_versionado(db, models.PlanosSQL, models.PlanosSQL.id_plano, plano_id, valores, if_match, "plano")
+    if alterado:
+        cache.planos.invalidate()
+        etags.bump(etags.PLANOS)
+    return db_plano
 
 def update_membro_plano(db: Session, membro_id: int, plano_id: int):
     # Check if both the member and the plan exist
@@ -222,44 +530,108 @@ def update_membro_plano(db: Session, membro_id: int, plano_id: int):
     # Create a list with all the plano IDs
     ids_planos = [plano.id_plano for plano in existing_membro.planos]
 
-    # Commit the changes to the database
+    # Log it in the outbox and commit the changes to the database
+    changes.registrar(db, [changes.alteracao(changes.MEMBRO_PLANO, changes.CRIACAO, id_membro=membro_id, id_plano=plano_id)])
     db.commit()
+    etags.bump(etags.MEMBRO_PLANO)
     db.refresh(existing_membro)
     return {"id_membro": [existing_membro.id_membro], "ids_plano": ids_planos}
 
+def _check_pares(db: Session, pares: list):
+    # Split the pairs into the ones whose membro and plano exist and the ones to ignore, and find which already exist
+    ids_membro = list({id_membro for id_membro, _ in pares})
+    ids_plano = list({id_plano for _, id_plano in pares})
+    membros_existentes = set()
+    for chunk in _chunks(ids_membro):
+        membros_existentes.update(db.scalars(select(models.MembrosSQL.id_membro).where(models.MembrosSQL.id_membro.in_(chunk))))
+    planos_existentes = set()
+    for chunk in _chunks(ids_plano):
+        planos_existentes.update(db.scalars(select(models.PlanosSQL.id_plano).where(models.PlanosSQL.id_plano.in_(chunk))))
+
+    validos = []
+    ignorados = []
+    for id_membro, id_plano in pares:
+        if id_membro not in membros_existentes:
+            ignorados.append({"id_membro": id_membro, "id_plano": id_plano, "detail": "Error - membro não existe"})
+        elif id_plano not in planos_existentes:
+            ignorados.append({"id_membro": id_membro, "id_plano": id_plano, "detail": "Error - plano não existe"})
+        else:
+            validos.append((id_membro, id_plano))
+
+    # Pairs already in the association table
+    association = models.membro_plano_association
+    pares_existentes = set()
+    for chunk in _chunks(validos):
+        pares_existentes.update(db.execute(
+            select(association.c.membro_id, association.c.plano_id)
+            .where(tuple_(association.c.membro_id, association.c.plano_id).in_(chunk))
+        ).tuples())
+    return validos, ignorados, pares_existentes
+
+def _insert_ignorando_duplicados(db: Session, table):
+    # INSERT that skips the pairs inserted concurrently, instead of failing the whole statement
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(table)
+        return stmt.on_duplicate_key_update(membro_id=stmt.inserted.membro_id)
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return insert(table)
+
+def update_membros_planos(db: Session, pares: list):
+    # Add the planos to the membros with set-based statements, instead of one request per pair
+    validos, ignorados, pares_existentes = _check_pares(db, pares)
+    for id_membro, id_plano in validos:
+        if (id_membro, id_plano) in pares_existentes:
+            ignorados.append({"id_membro": id_membro, "id_plano": id_plano, "detail": "Error - membro já tem esse plano"})
+    novos = [par for par in validos if par not in pares_existentes]
+
+    # Insert the new pairs in the association table, and their entries in the outbox
+    stmt = _insert_ignorando_duplicados(db, models.membro_plano_association)
+    for chunk in _chunks(novos):
+        db.execute(stmt, [{"membro_id": id_membro, "plano_id": id_plano} for id_membro, id_plano in chunk])
+
+    # Log them in the outbox, right before the commit, and commit the changes to the database
+    changes.registrar(db, [changes.alteracao(changes.MEMBRO_PLANO, changes.CRIACAO, id_membro=id_membro, id_plano=id_plano) for id_membro, id_plano in novos])
+    db.commit()
+    if novos:
+        etags.bump(etags.MEMBRO_PLANO)
+    return {"aplicados": [{"id_membro": id_membro, "id_plano": id_plano} for id_membro, id_plano in novos], "ignorados": ignorados}
+
 # ==== DELETE ====
 
 def delete_membro(db: Session, membro_id: int):
-    # First, check if the member with the specified ID exists
-    existing_membro = get_membro(db, membro_id)
-    
+    # Delete the relationships between the membro and the planos, then the member, without loading them
+    db.execute(delete(models.membro_plano_association).where(models.membro_plano_association.c.membro_id == membro_id))
+    result = db.execute(delete(models.MembrosSQL).where(models.MembrosSQL.id_membro == membro_id))
+
     # Raise an HTTPException with a 400 status code if the member doesn't exist
-    if not existing_membro:
+    if result.rowcount == 0:
+        db.rollback()
         raise HTTPException(status_code=400, detail=f'Error - membro não existe')
 
-    # Delete the relationships between the membro and the planos
-    existing_membro.planos.clear()
-    
-    # Delete the member from the database
-    db.delete(existing_membro)
+    # Log it in the outbox, the removal of the membro implies the removal of its planos
+    changes.registrar(db, [changes.alteracao(changes.MEMBROS, changes.REMOCAO, id_membro=membro_id)])
     db.commit()
-    return {"id_membro": existing_membro.id_membro}
+    etags.bump(etags.MEMBROS, etags.MEMBRO_PLANO)
+    return {"id_membro": membro_id}
 
 def delete_plano(db: Session, plano_id: int):
-    # First, check if the plan with the specified ID exists
-    existing_plano = get_plano(db, plano_id)
+    # Delete the relationships between the membros and the plano, then the plan, without loading them
+    db.execute(delete(models.membro_plano_association).where(models.membro_plano_association.c.plano_id == plano_id))
+    result = db.execute(delete(models.PlanosSQL).where(models.PlanosSQL.id_plano == plano_id))
 
     # Raise an HTTPException with a 400 status code if the plan doesn't exist
-    if not existing_plano:
+    if result.rowcount == 0:
+        db.rollback()
         raise HTTPException(status_code=400, detail=f'Error - plano não existe')
-    
-    # Delete the relationships between the membro and the planos
-    existing_plano.membros.clear()
 
-    # Delete the plan from the database
-    db.delete(existing_plano)
+    # Log it in the outbox, the removal of the plano implies its removal from the membros
+    changes.registrar(db, [changes.alteracao(changes.PLANOS, changes.REMOCAO, id_plano=plano_id)])
     db.commit()
-    return {"id_plano": existing_plano.id_plano}
+    cache.planos.invalidate()
+    etags.bump(etags.PLANOS, etags.MEMBRO_PLANO)
+    return {"id_plano": plano_id}
 
 def delete_membro_plano(db: Session, membro_id: int, plano_id: int):
     # Check if both the member and the plan exist
@@ -283,7 +655,29 @@ def delete_membro_plano(db: Session, membro_id: int, plano_id: int):
     # Create a list with all the plano IDs
     ids_planos = [plano.id_plano for plano in existing_membro.planos]
 
-    # Commit the changes to the database
+    # Log it in the outbox and commit the changes to the database
+    changes.registrar(db, [changes.alteracao(changes.MEMBRO_PLANO, changes.REMOCAO, id_membro=membro_id, id_plano=plano_id)])
     db.commit()
+    etags.bump(etags.MEMBRO_PLANO)
     db.refresh(existing_membro)
     return {"id_membro": [existing_membro.id_membro], "ids_plano": ids_planos}
+
+def delete_membros_planos(db: Session, pares: list):
+    # Remove the planos from the membros with set-based statements, instead of one request per pair
+    validos, ignorados, pares_existentes = _check_pares(db, pares)
+    for id_membro, id_plano in validos:
+        if (id_membro, id_plano) not in pares_existentes:
+            ignorados.append({"id_membro": id_membro, "id_plano": id_plano, "detail": "Error - membro não tem esse plano"})
+    removidos = [par for par in validos if par in pares_existentes]
+
+    # Delete the pairs from the association table, and log them in the outbox
+    association = models.membro_plano_association
+    for chunk in _chunks(removidos):
+        db.execute(delete(association).where(tuple_(association.c.membro_id, association.c.plano_id).in_(chunk)))
+
+    # Log them in the outbox, right before the commit, and commit the changes to the database
+    changes.registrar(db, [changes.alteracao(changes.MEMBRO_PLANO, changes.REMOCAO, id_membro=id_membro, id_plano=id_plano) for id_membro, id_plano in removidos])
+    db.commit()
+    if removidos:
+        etags.bump(etags.MEMBRO_PLANO)
+    return {"aplicados": [{"id_membro": id_membro, "id_plano": id_plano} for id_membro, id_plano in removidos], "ignorados": ignorados}
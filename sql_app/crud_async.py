@@ -0,0 +1,315 @@
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import cache, changes, etags, hashing, models, schemas
+from .crud import _membros_listing, _valor_diferente, is_duplicate_key
+from fastapi import HTTPException
+
+# Async versions of the functions in crud.py, used by sql_app.main_async.
+# Relationships can't be lazily loaded in async code, so the membro/plano links
+# are always read and written through the association table.
+
+
+# ==== GET ====
+
+async def get_membro(db: AsyncSession, membro_id: int, modo_criar = False):
+    # First, check if the member exists
+    existing_membro = await db.get(models.MembrosSQL, membro_id)
+
+    # Raise an HTTPException with a 400 status code if the member doesn't exist
+    if not existing_membro and not modo_criar:
+        raise HTTPException(status_code=400, detail="Error - membro não existe")
+
+    # Return the member
+    return existing_membro
+
+async def get_all_membros(db: AsyncSession, limit: int = None, after: tuple = None, filtros: schemas.MembrosFiltro = None,
+                          sort: str = "id_membro", fields: tuple = None):
+    # Keyset pagination: the membros are ordered by the sort column and the id, and the page starts right after the cursor
+    query = _membros_listing(after, False, filtros, sort, fields)
+    if limit is not None:
+        query = query.limit(limit)
+    return (await db.scalars(query)).all()
+
+async def iter_membros(db: AsyncSession, after: tuple = None, chunk_size: int = 1000, filtros: schemas.MembrosFiltro = None,
+                       sort: str = "id_membro", fields: tuple = None):
+    # Stream the membros from the database in chunks, without loading the whole table at once
+    query = _membros_listing(after, False, filtros, sort, fields)
+    result = await db.stream_scalars(query.execution_options(yield_per=chunk_size))
+    async for chunk in result.partitions():
+        yield chunk
+
+async def get_plano(db: AsyncSession, plano_id: int, modo_criar = False):
+    # First, check if the plan exists
+    existing_plano = await db.get(models.PlanosSQL, plano_id)
+
+    # Raise an HTTPException with a 400 status code if the plan doesn't exist
+    if not existing_plano and not modo_criar:
+        raise HTTPException(status_code=400, detail="Error - plano não existe")
+
+    # Return the plan
+    return existing_plano
+
+async def get_all_planos(db: AsyncSession, limit: int = None, after: int = None):
+    # Keyset pagination: the planos are ordered by id and the page starts right after the cursor
+    query = select(models.PlanosSQL).order_by(models.PlanosSQL.id_plano)
+    if after is not None:
+        query = query.where(models.PlanosSQL.id_plano > after)
+    if limit is not None:
+        query = query.limit(limit)
+    return (await db.scalars(query)).all()
+
+async def iter_planos(db: AsyncSession, after: int = None, chunk_size: int = 1000):
+    # Stream the planos from the database in chunks, without loading the whole table at once
+    query = select(models.PlanosSQL).order_by(models.PlanosSQL.id_plano)
+    if after is not None:
+        query = query.where(models.PlanosSQL.id_plano > after)
+    result = await db.stream_scalars(query.execution_options(yield_per=chunk_size))
+    async for chunk in result.partitions():
+        yield chunk
+
+async def get_membros_ativos(db: AsyncSession):
+    # Subquery that checks, through the association table, if the membro has at least one active plano
+    has_plano_ativo = (
+        select(models.membro_plano_association.c.membro_id)
+        .join(models.PlanosSQL, models.PlanosSQL.id_plano == models.membro_plano_association.c.plano_id)
+        .where(models.membro_plano_association.c.membro_id == models.MembrosSQL.id_membro)
+        .where(models.PlanosSQL.ativo == True)
+        .exists()
+    )
+
+    # Get all the active membros with a single query
+    membros_ativos = (await db.scalars(select(models.MembrosSQL).where(has_plano_ativo).order_by(models.MembrosSQL.id_membro))).all()
+
+    # Raise an HTTPException with a 400 status code if there are no active membros
+    if not membros_ativos:
+        raise HTTPException(status_code=400, detail="Error - nenhum membro com plano ativo")
+
+    # Return the list of active membros
+    return membros_ativos
+
+async def get_membros_plano(db: AsyncSession, plano_id: int):
+    # First, check if the plan exists
+    await get_plano(db, plano_id)
+
+    # Get the membros with the plan by joining with the association table
+    membros_plano = (await db.scalars(
+        select(models.MembrosSQL)
+        .join(models.membro_plano_association, models.membro_plano_association.c.membro_id == models.MembrosSQL.id_membro)
+        .where(models.membro_plano_association.c.plano_id == plano_id)
+        .order_by(models.MembrosSQL.id_membro)
+    )).all()
+
+    # Raise an HTTPException with a 400 status code if there are no membros with the plan
+    if not membros_plano:
+        raise HTTPException(status_code=400, detail="Error - nenhum membro com esse plano")
+
+    # Return the list of membros with the plan
+    return membros_plano
+
+async def get_planos_membro(db: AsyncSession, membro_id: int):
+    # First, check if the member exists
+    await get_membro(db, membro_id)
+
+    # Get the member's planos by joining with the association table
+    planos_membro = (await db.scalars(
+        select(models.PlanosSQL)
+        .join(models.membro_plano_association, models.membro_plano_association.c.plano_id == models.PlanosSQL.id_plano)
+        .where(models.membro_plano_association.c.membro_id == membro_id)
+        .order_by(models.PlanosSQL.id_plano)
+    )).all()
+
+    # Return the member's planos
+    return planos_membro
+
+async def _get_ids_planos(db: AsyncSession, membro_id: int):
+    # Ids of the planos of a membro, read straight from the association table
+    return (await db.scalars(
+        select(models.membro_plano_association.c.plano_id)
+        .where(models.membro_plano_association.c.membro_id == membro_id)
+        .order_by(models.membro_plano_association.c.plano_id)
+    )).all()
+
+# ==== POST ====
+
+async def create_membro(db: AsyncSession, membro: schemas.MembroCreate):
+    # Create the row of the member, with its password hashed with bcrypt in the hashing worker pool
+    db_membro = dict(membro.model_dump(exclude={"password"}), hashed_password=await hashing.hash_password_async(f'{membro.password}'))
+
+    # Insert the member straight away, the primary key rejects an existing id, and log it in the outbox
+    try:
+        await db.execute(insert(models.MembrosSQL), [db_membro])
+        await changes.registrar_async(db, [changes.alteracao(changes.MEMBROS, changes.CRIACAO, id_membro=membro.id_membro, dados=dict(db_membro, versao=1))])
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        # Raise an HTTPException with a 400 status code if the member already exists
+        if is_duplicate_key(e):
+            raise HTTPException(status_code=400, detail="Error - membro já existe")
+        raise
+    etags.bump(etags.MEMBROS)
+    return dict(db_membro, versao=1)
+
+async def create_plano(db: AsyncSession, plano: schemas.PlanoCreate):
+    # Create the row of the plan
+    db_plano = plano.model_dump()
+
+    # Insert the plan straight away, the primary key rejects an existing id, and log it in the outbox
+    try:
+        await db.execute(insert(models.PlanosSQL), [db_plano])
+        await changes.registrar_async(db, [changes.alteracao(changes.PLANOS, changes.CRIACAO, id_plano=plano.id_plano, dados=dict(db_plano, versao=1))])
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        # Raise an HTTPException with a 400 status code if the plan already exists
+        if is_duplicate_key(e):
+            raise HTTPException(status_code=400, detail="Error - plano já existe")
+        raise
+    cache.planos.invalidate()
+    etags.bump(etags.PLANOS)
+    return dict(db_plano, versao=1)
+
+# ==== UPDATE ====
+
+async def _update_versionado(db: AsyncSession, model, id_column, row_id: int, valores: dict, if_match: int, nome: str):
+    # UPDATE only the columns that were sent and bump the versao, with the If-Match check in the WHERE, and only when
+    # some value changes. Return the row and whether it changed (see crud._update_versionado)
+    condicoes = [id_column == row_id]
+    if if_match is not None:
+        condicoes.append(model.versao == if_match)
+
+    row = None
+    if valores:
+        diferente = or_(*(_valor_diferente(db.bind.dialect, getattr(model, coluna), valor) for coluna, valor in valores.items()))
+        stmt = update(model).where(*condicoes, diferente).values(**valores, versao=model.versao + 1)
+        stmt = stmt.execution_options(synchronize_session=False)
+        if db.bind.dialect.update_returning:
+            # Get the updated row back in the same statement
+            row = (await db.execute(stmt.returning(*model.__table__.c))).mappings().first()
+        elif (await db.execute(stmt)).rowcount:
+            row = (await db.execute(select(*model.__table__.c).where(id_column == row_id))).mappings().first()
+    alterado = row is not None
+
+    if row is None:
+        # Nothing to change, just check the conditions
+        row = (await db.execute(select(*model.__table__.c).where(*condicoes))).mappings().first()
+
+    if row is None:
+        await db.rollback()
+        # Tell apart a missing row from a version conflict, only when the update didn't go through
+        versao = await db.scalar(select(model.versao).where(id_column == row_id))
+        # Raise an HTTPException with a 400 status code if the row doesn't exist
+        if versao is None:
+            raise HTTPException(status_code=400, detail=f'Error - {nome} não existe')
+        # And with a 412 status code if someone else changed it since the version the client sent
+        raise HTTPException(status_code=412, detail=f'Error - {nome} foi alterado, versão atual {versao}',
+                            headers={"ETag": etags.row_etag(versao)})
+
+    # Log the columns that were written in the outbox, then commit the changes to the database
+    if alterado:
+        await changes.registrar_async(db, [changes.alteracao(model.__tablename__, changes.ALTERACAO, dados=dict(valores, versao=row["versao"]), **{id_column.key: row_id})])
+    await db.commit()
+    return dict(row), alterado
+
+async def update_membro(db: AsyncSession, membro: schemas.MembroUpdate, membro_id: int, if_match: int = None):
+    # Only the fields that were sent are updated
+    valores = membro.model_dump(exclude_unset=True, exclude={"id_membro", "password"})
+
+    # Hash the password only when a new one is sent
+    if membro.password is not None:
+        valores["hashed_password"] = await hashing.hash_password_async(f'{membro.password}')
+
+    db_membro, alterado = await _update_versionado(db, models.MembrosSQL, models.MembrosSQL.id_membro, membro_id, valores, if_match, "membro")
+    if alterado:
+        etags.bump(etags.MEMBROS)
+    return db_membro
+
+async def update_plano(db: AsyncSession, plano: schemas.PlanoUpdate, plano_id: int, if_match: int = None):
+    # Only the fields that were sent are updated
+    valores = plano.model_dump(exclude_unset=True, exclude={"id_plano"})
+
+    db_plano, alterado = await _update_versionado(db, models.PlanosSQL, models.PlanosSQL.id_plano, plano_id, valores, if_match, "plano")
+    if alterado:
+        cache.planos.invalidate()
+        etags.bump(etags.PLANOS)
+    return db_plano
+
+async def update_membro_plano(db: AsyncSession, membro_id: int, plano_id: int):
+    # Check if both the member and the plan exist
+    await get_membro(db, membro_id)
+    await get_plano(db, plano_id)
+
+    # Check if the membro already has the plan
+    ids_planos = await _get_ids_planos(db, membro_id)
+    if plano_id in ids_planos:
+        raise HTTPException(status_code=400, detail=f'Error - membro já tem esse plano')
+
+    # Add the plan to the membro, and log it in the outbox
+    await db.execute(insert(models.membro_plano_association).values(membro_id=membro_id, plano_id=plano_id))
+    await changes.registrar_async(db, [changes.alteracao(changes.MEMBRO_PLANO, changes.CRIACAO, id_membro=membro_id, id_plano=plano_id)])
+
+    # Commit the changes to the database
+    await db.commit()
+    etags.bump(etags.MEMBRO_PLANO)
+    return {"id_membro": [membro_id], "ids_plano": sorted([*ids_planos, plano_id])}
+
+# ==== DELETE ====
+
+async def delete_membro(db: AsyncSession, membro_id: int):
+    # Delete the relationships between the membro and the planos, then the member
+    await db.execute(delete(models.membro_plano_association).where(models.membro_plano_association.c.membro_id == membro_id))
+    result = await db.execute(delete(models.MembrosSQL).where(models.MembrosSQL.id_membro == membro_id))
+
+    # Raise an HTTPException with a 400 status code if the member doesn't exist
+    if result.rowcount == 0:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Error - membro não existe")
+
+    # Log it in the outbox, the removal of the membro implies the removal of its planos
+    await changes.registrar_async(db, [changes.alteracao(changes.MEMBROS, changes.REMOCAO, id_membro=membro_id)])
+    await db.commit()
+    etags.bump(etags.MEMBROS, etags.MEMBRO_PLANO)
+    return {"id_membro": membro_id}
+
+async def delete_plano(db: AsyncSession, plano_id: int):
+    # Delete the relationships between the membros and the plano, then the plan
+    await db.execute(delete(models.membro_plano_association).where(models.membro_plano_association.c.plano_id == plano_id))
+    result = await db.execute(delete(models.PlanosSQL).where(models.PlanosSQL.id_plano == plano_id))
+
+    # Raise an HTTPException with a 400 status code if the plan doesn't exist
+    if result.rowcount == 0:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Error - plano não existe")
+
+    # Log it in the outbox, the removal of the plano implies its removal from the membros
+    await changes.registrar_async(db, [changes.alteracao(changes.PLANOS, changes.REMOCAO, id_plano=plano_id)])
+    await db.commit()
+    cache.planos.invalidate()
+    etags.bump(etags.PLANOS, etags.MEMBRO_PLANO)
+    return {"id_plano": plano_id}
+
+async def delete_membro_plano(db: AsyncSession, membro_id: int, plano_id: int):
+    # Check if both the member and the plan exist
+    await get_membro(db, membro_id)
+    await get_plano(db, plano_id)
+
+    # Remove the plan from the membro
+    result = await db.execute(
+        delete(models.membro_plano_association)
+        .where(models.membro_plano_association.c.membro_id == membro_id)
+        .where(models.membro_plano_association.c.plano_id == plano_id)
+    )
+
+    # Raise an HTTPException with a 400 status code if the member doesn't have the plan
+    if result.rowcount == 0:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f'Error - membro não tem esse plano')
+
+    # Create a list with the remaining plano IDs
+    ids_planos = await _get_ids_planos(db, membro_id)
+
+    # Log it in the outbox and commit the changes to the database
+    await changes.registrar_async(db, [changes.alteracao(changes.MEMBRO_PLANO, changes.REMOCAO, id_membro=membro_id, id_plano=plano_id)])
+    await db.commit()
+    etags.bump(etags.MEMBRO_PLANO)
+    return {"id_membro": [membro_id], "ids_plano": ids_planos}
@@ -1,9 +1,10 @@
 import logging
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
+from . import instrumentation, pool_metrics
 
 # Open the .env file and read the value of the DATABASE_URL variable
 load_dotenv(override=True)
@@ -13,11 +14,42 @@ DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_PORT = os.getenv('DB_PORT')
 DB_NAME = os.getenv('DB_NAME')
 
-# MySQL Database
-SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# MySQL Database (DATABASE_URL overrides it, e.g. with sqlite:///./academia.db for local testing)
+SQLALCHEMY_DATABASE_URL = os.getenv('DATABASE_URL', f"mysql+pymysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+
+# Async MySQL Database, used by sql_app.main_async (ASYNC_DATABASE_URL overrides it, e.g. with sqlite+aiosqlite:///./academia.db)
+SQLALCHEMY_ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL', f"mysql+aiomysql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+
+# Connection pool settings, per process: with N workers the database sees up to N * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800)) # seconds, below the server/RDS idle timeout
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+
+# Create the missing tables when the app starts, for local development only: the schema is managed by the
+# migrations (alembic upgrade head), run once per deploy instead of by every worker at boot
+CREATE_TABLES = os.getenv('CREATE_TABLES', 'false').lower() in ('1', 'true', 'yes')
+
+def pool_options(url: str, poolclass):
+    # In-memory SQLite uses a single-connection pool that takes none of these settings
+    parsed_url = make_url(url)
+    if parsed_url.get_backend_name() == 'sqlite' and parsed_url.database in (None, '', ':memory:'):
+        return {}
+    return dict(
+        poolclass=poolclass,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
 
 try:
-    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, **pool_options(SQLALCHEMY_DATABASE_URL, pool_metrics.InstrumentedQueuePool))
+    if isinstance(engine.pool, pool_metrics.InstrumentedQueuePool):
+        pool_metrics.instrument(engine)
+    instrumentation.instrument(engine)
 except Exception as e:
     logging.error(f"Database connection error: {str(e)}")
     raise
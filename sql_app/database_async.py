@@ -0,0 +1,20 @@
+import logging
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from . import instrumentation, pool_metrics
+from .database import SQLALCHEMY_ASYNC_DATABASE_URL, pool_options
+
+try:
+    async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, **pool_options(SQLALCHEMY_ASYNC_DATABASE_URL, pool_metrics.InstrumentedAsyncAdaptedQueuePool))
+    if isinstance(async_engine.pool, pool_metrics.InstrumentedAsyncAdaptedQueuePool):
+        pool_metrics.instrument(async_engine.sync_engine)
+    instrumentation.instrument(async_engine.sync_engine)
+except Exception as e:
+    logging.error(f"Database connection error: {str(e)}")
+    raise
+
+# expire_on_commit=False, attribute access after a commit can't lazily hit the database in async code
+AsyncSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=async_engine, class_=AsyncSession)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
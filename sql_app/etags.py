@@ -0,0 +1,119 @@
+import os
+import threading
+import uuid
+from fastapi import HTTPException, Request
+
+# Cache-Control of the catalog routes. The responses carry a weak ETag, so once max-age is over the clients
+# revalidate with If-None-Match and get a body-less 304 while the tables haven't changed
+CACHE_CONTROL_PLANOS = os.getenv('CACHE_CONTROL_PLANOS', 'public, max-age=5')
+# The planos of a membro are personal data: only the client may keep them, and it revalidates every time
+CACHE_CONTROL_PLANOS_MEMBRO = os.getenv('CACHE_CONTROL_PLANOS_MEMBRO', 'private, no-cache')
+
+# Number of worker processes serving the app, set by gunicorn.conf.py
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+
+# Tables whose version goes into the ETags
+MEMBROS = "membros"
+PLANOS = "planos"
+MEMBRO_PLANO = "membro_plano_association"
+
+
+class VersionBackend:
+    """Version counters of the tables. Implement it to share the counters between worker processes (e.g. Redis INCR)."""
+
+    # Part of every ETag, a shared backend uses a fixed one so the workers issue the same ETags
+    token = ""
+    # Whether every worker process sees the bumps of the others
+    shared = True
+
+    def get(self, table: str) -> int:
+        raise NotImplementedError
+
+    def incr(self, table: str):
+        raise NotImplementedError
+
+
+class MemoryVersionBackend(VersionBackend):
+    """In-process counters. Each process has its own token, so the ETags issued before a restart never match again.
+
+    With several worker processes a write only bumps the counters of the worker that served it, and the other
+    workers could answer 304 for a stale copy, so the ETags are turned off unless a single worker runs."""
+
+    shared = False
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex[:8]
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, table: str):
+        return self._counters.get(table, 0)
+
+    def incr(self, table: str):
+        with self._lock:
+            self._counters[table] = self._counters.get(table, 0) + 1
+
+
+backend = MemoryVersionBackend()
+_lock = threading.Lock()
+_counters = {"not_modified": 0}
+
+def set_versions_backend(new_backend: VersionBackend):
+    global backend
+    backend = new_backend
+
+def bump(*tables: str):
+    # Called after the write is committed, so an ETag is never attached to data older than its version
+    for table in tables:
+        backend.incr(table)
+
+def enabled():
+    # The ETags are only trusted when every worker sees every bump
+    return backend.shared or WEB_CONCURRENCY <= 1
+
+def etag(*tables: str):
+    # Weak ETag: the same JSON may be serialized with a different byte layout
+    return 'W/"' + "-".join([backend.token, *(str(backend.get(table)) for table in tables)]) + '"'
+
+def _matches(if_none_match: str, current: str):
+    # Weak comparison, as required for If-None-Match
+    if if_none_match.strip() == "*":
+        return True
+    opaque = current.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+def conditional(request: Request, cache_control: str, *tables: str):
+    # Headers of a cacheable response. Raises a 304 when the client's copy is current, before the database is read,
+    # and the version is read before the data so a concurrent write can only make the ETag older, never newer
+    if not enabled():
+        return {"Cache-Control": cache_control}
+    headers = {"ETag": etag(*tables), "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, headers["ETag"]):
+        with _lock:
+            _counters["not_modified"] += 1
+        raise HTTPException(status_code=304, headers=headers)
+    return headers
+
+def row_etag(versao: int):
+    # Strong ETag of a single membro or plano, its versao column
+    return f'"{versao}"'
+
+def parse_if_match(if_match: str):
+    # Version the row must still be at for the write to go through, None when any version will do.
+    # If-Match uses the strong comparison, so a weak ETag (e.g. of the catalog routes) never matches
+    if if_match is None or if_match.strip() == "*":
+        return None
+    candidate = if_match.strip()
+    if not (len(candidate) > 2 and candidate[0] == candidate[-1] == '"' and candidate[1:-1].isdigit()):
+        raise HTTPException(status_code=412, detail="Error - If-Match deve ser a versão do registro, ex: \"3\"")
+    return int(candidate[1:-1])
+
+def get_metrics():
+    with _lock:
+        not_modified = _counters["not_modified"]
+    return {
+        "enabled": enabled(),
+        "not_modified": not_modified,
+        "versions": {table: backend.get(table) for table in (MEMBROS, PLANOS, MEMBRO_PLANO)},
+    }
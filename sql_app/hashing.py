@@ -0,0 +1,89 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+import bcrypt
+
+# Number of processes used to hash passwords (0 hashes on the calling thread, or on a thread of the event loop's
+# default executor for the async routes). Each web worker has its own
+# pool, so by default the CPUs are split between the WEB_CONCURRENCY workers set by gunicorn.conf.py
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+HASH_ROUNDS = 10
+
+_executor = None
+_lock = threading.Lock()
+_metrics = {
+    "queue_depth": 0,
+    "hashes_total": 0,
+    "duration_seconds_total": 0.0,
+    "duration_seconds_max": 0.0,
+}
+
+
+def _hashpw(password: str):
+    # Runs inside the worker process
+    return bcrypt.hashpw(password.encode('utf8'), bcrypt.gensalt(rounds=HASH_ROUNDS)).decode('utf8')
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Spawn the workers, forking a process that holds threads and DB connections is unsafe
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+def _record(started: float):
+    # Called once the hash is done, successfully or not
+    duration = time.perf_counter() - started
+    with _lock:
+        _metrics["queue_depth"] -= 1
+        _metrics["hashes_total"] += 1
+        _metrics["duration_seconds_total"] += duration
+        _metrics["duration_seconds_max"] = max(_metrics["duration_seconds_max"], duration)
+
+def submit_hash(password: str):
+    # Dispatch the hash to the pool, the returned future resolves to the hashed password
+    with _lock:
+        _metrics["queue_depth"] += 1
+    started = time.perf_counter()
+
+    if HASH_WORKERS <= 0:
+        future = Future()
+        try:
+            future.set_result(_hashpw(password))
+        except Exception as e:
+            future.set_exception(e)
+    else:
+        future = _get_executor().submit(_hashpw, password)
+
+    future.add_done_callback(lambda _: _record(started))
+    return future
+
+def hash_password(password: str):
+    # Block the calling thread (not the event loop) until the worker returns the hash
+    return submit_hash(password).result()
+
+def hash_passwords(passwords: list[str]):
+    # Submit every password before waiting, so they are hashed in parallel across the workers
+    futures = [submit_hash(password) for password in passwords]
+    return [future.result() for future in futures]
+
+async def hash_password_async(password: str):
+    if HASH_WORKERS <= 0:
+        # Without a pool the hash would run inline and block the event loop for its whole duration
+        return await asyncio.get_running_loop().run_in_executor(None, hash_password, password)
+    return await asyncio.wrap_future(submit_hash(password))
+
+def get_metrics():
+    with _lock:
+        return dict(_metrics, workers=HASH_WORKERS)
+
+def shutdown():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
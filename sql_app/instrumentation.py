@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+
+# Statements slower than this (milliseconds) are logged, with their parameters redacted
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+
+# Upper bounds of the histogram buckets, per route
+DB_MS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float("inf"))
+QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, float("inf"))
+
+slow_query_logger = logging.getLogger("sql_app.slow_query")
+
+
+class RequestStats:
+    """Statements issued by the current request, shared with the threads and tasks that serve it."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+# Stats of the request being served, None outside of a request (e.g. startup)
+_request_stats: ContextVar = ContextVar("request_stats", default=None)
+
+_lock = threading.Lock()
+_routes = {}
+
+
+def instrument(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            parameter_sets = len(parameters) if executemany else 1
+            slow_query_logger.warning(
+                "slow query (%.1f ms, %d parameter set(s) redacted): %s",
+                elapsed * 1000, parameter_sets, " ".join(statement.split()),
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # The statement failed, after_cursor_execute won't pop its start time
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+def _bucket(buckets: tuple, value: float):
+    return next(index for index, bound in enumerate(buckets) if value <= bound)
+
+def _record(route: str, stats: RequestStats):
+    db_ms = stats.db_seconds * 1000
+    with _lock:
+        metrics = _routes.setdefault(route, {
+            "requests": 0,
+            "queries_total": 0,
+            "db_seconds_total": 0.0,
+            "db_ms_histogram": [0] * len(DB_MS_BUCKETS),
+            "queries_histogram": [0] * len(QUERIES_BUCKETS),
+        })
+        metrics["requests"] += 1
+        metrics["queries_total"] += stats.queries
+        metrics["db_seconds_total"] += stats.db_seconds
+        metrics["db_ms_histogram"][_bucket(DB_MS_BUCKETS, db_ms)] += 1
+        metrics["queries_histogram"][_bucket(QUERIES_BUCKETS, stats.queries)] += 1
+
+def _server_timing(stats: RequestStats):
+    return f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.queries} queries"'.encode("latin-1")
+
+class SQLMetricsMiddleware:
+    """Counts the statements of each request, reports them in Server-Timing and in the per-route metrics.
+
+    A plain ASGI middleware, so a streamed body (NDJSON, SSE) runs inside the request and its statements are counted.
+    Their total is only known once the body is sent, after the headers: those responses have no Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        started = False
+        held = None
+
+        async def send_with_stats(message):
+            nonlocal started, held
+            if message["type"] == "http.response.start":
+                # Held until the first part of the body, which tells whether the response is streamed
+                started = True
+                held = message
+                return
+            if held is not None:
+                start, held = held, None
+                if message["type"] == "http.response.body" and not message.get("more_body", False):
+                    start = dict(start, headers=[*start.get("headers", []), (b"server-timing", _server_timing(stats))])
+                await send(start)
+            await send(message)
+
+        token = _request_stats.set(stats)
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _request_stats.reset(token)
+            # After the last part of the body, or once a stream was interrupted (e.g. the SSE client disconnected)
+            if started:
+                route = scope.get("route")
+                _record(f"{scope['method']} {route.path if route else 'unmatched'}", stats)
+
+def get_metrics():
+    with _lock:
+        routes = {
+            route: dict(
+                metrics,
+                db_ms_histogram=dict(zip(map(str, DB_MS_BUCKETS), metrics["db_ms_histogram"])),
+                queries_histogram=dict(zip(map(str, QUERIES_BUCKETS), metrics["queries_histogram"])),
+            )
+            for route, metrics in _routes.items()
+        }
+    return {"slow_query_ms": SLOW_QUERY_MS, "routes": routes}
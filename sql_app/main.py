@@ -1,12 +1,52 @@
-from fastapi import Depends, FastAPI, HTTPException
+import asyncio
+import json
+import os
+from typing import Literal, Union
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 import bcrypt
-from . import crud, models, schemas
-from .database import SessionLocal, engine
+from . import cache, changes, coalescing, crud, etags, hashing, instrumentation, models, pool_metrics, schemas, stats, warmup
+from .serialization import dump_json, json_response, membro_com_planos_adapter, membro_projection, membros_adapter, membros_com_planos_adapter, membros_projection_adapter, planos_adapter
+from .database import CREATE_TABLES, SessionLocal, engine
 
-models.Base.metadata.create_all(bind=engine)
+# Served in production with: gunicorn sql_app.main:app -c gunicorn.conf.py
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+app.add_middleware(instrumentation.SQLMetricsMiddleware)
+
+# Number of rows fetched from the database per chunk when streaming NDJSON
+STREAM_CHUNK_SIZE = 1000
+
+# Number of rows inserted per transaction by the bulk endpoints
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', 1000))
+
+@app.on_event("startup")
+def warm_up():
+    if CREATE_TABLES:
+        models.Base.metadata.create_all(bind=engine)
+    warmup.warmup(engine, SessionLocal)
+
+@app.on_event("startup")
+def start_stats_refresher():
+    stats.start_refresher()
+
+@app.on_event("shutdown")
+def shutdown_hashing():
+    hashing.shutdown()
+
+@app.on_event("shutdown")
+def stop_stats_refresher():
+    stats.stop_refresher()
+
+@app.on_event("startup")
+def start_changes_pruner():
+    changes.start_pruner()
+
+@app.on_event("shutdown")
+def stop_changes_pruner():
+    changes.stop_pruner()
 
 def get_db():
     db = SessionLocal()
@@ -15,53 +55,181 @@ def get_db():
     finally:
         db.close()
 
+# Query parameter of the membro routes that can also return the planos of each membro
+IncludeQuery = Query(None, description="Use `include=planos` para retornar também os planos de cada membro (carregados com uma única consulta extra)")
+
+def stream_ndjson(iter_rows, schema, after: Union[int, None], **kwargs):
+    # The stream owns its session, since it outlives the request handler
+    with SessionLocal() as db:
+        for chunk in iter_rows(db, after, STREAM_CHUNK_SIZE, **kwargs):
+            yield "".join(schema.model_validate(row).model_dump_json() + "\n" for row in chunk)
+
+async def read_bulk_lines(request: Request):
+    # Yield (line number, parsed json) for each row of a JSON array or of a NDJSON stream, read as it arrives
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        linha = 0
+        buffer = b""
+        async for data in request.stream():
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                linha += 1
+                if line.strip():
+                    yield linha, line
+        if buffer.strip():
+            yield linha + 1, buffer
+        return
+
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Error - corpo não é um JSON válido")
+    if not isinstance(body, list):
+        raise HTTPException(status_code=400, detail="Error - corpo deve ser um array JSON ou NDJSON")
+    for linha, dados in enumerate(body, start=1):
+        yield linha, dados
+
+async def bulk_import(request: Request, db: Session, create_bulk):
+    # Validate and insert the rows chunk by chunk, each chunk in its own transaction
+    inseridos = 0
+    erros = []
+    chunk = []
+
+    async def flush():
+        nonlocal inseridos, chunk
+        chunk_inseridos, chunk_erros = await run_in_threadpool(create_bulk, db, chunk)
+        inseridos += chunk_inseridos
+        erros.extend(chunk_erros)
+        chunk = []
+
+    async for linha, dados in read_bulk_lines(request):
+        if isinstance(dados, bytes):
+            try:
+                dados = json.loads(dados)
+            except ValueError:
+                erros.append({"linha": linha, "id": None, "detail": "Error - linha não é um JSON válido"})
+                continue
+        chunk.append((linha, dados))
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            await flush()
+    if chunk:
+        await flush()
+
+    return {"inseridos": inseridos, "erros": sorted(erros, key=lambda erro: erro["linha"])}
+
 # ==== GET ====
 
-@app.get("/membros", response_model=list[schemas.Membro])
-def read_membros(db: Session = Depends(get_db)):
-    """Retorna uma lista com todos os membros cadastrados na academia."""
-    return crud.get_all_membros(db)
+@app.get("/membros", response_model=list[schemas.Membro], responses={400: {"description": "Error - cursor inválido"},
+                                                                     200: {"description": "Success - membros retornados", "content": {"application/x-ndjson": {}}}})
+def read_membros(limit: Union[int, None] = Query(None, ge=1, le=1000), after: Union[str, None] = None,
+                 stream: bool = False, include: Union[Literal["planos"], None] = IncludeQuery,
+                 sort: str = Query("id_membro", description=f"Coluna de ordenação, com `-` na frente para ordem decrescente: {', '.join(crud.MEMBROS_SORT_KEYS)}"),
+                 fields: Union[str, None] = Query(None, description=f"Campos retornados, separados por vírgula: {', '.join(crud.MEMBROS_FIELDS)}"),
+                 filtros: schemas.MembrosFiltro = Depends(), db: Session = Depends(get_db)):
+    """Retorna uma lista com todos os membros cadastrados na academia.
+
+    Com `limit`, retorna uma página e o cabeçalho `X-Next-Cursor` com o token a ser passado em `after` para buscar a próxima.
+    Com `stream=true`, retorna todos os membros (a partir de `after`) em NDJSON, sem carregar a tabela inteira em memória.
+    Com `include=planos`, cada membro traz a lista `planos`.
+    Os filtros (início do nome, sexo, intervalos de inscrição, nascimento e peso), a ordenação `sort` e a projeção `fields`
+    viram uma única consulta no banco; com `fields`, só as colunas pedidas são lidas e a senha nunca é retornada."""
+    include_planos = include == "planos"
+    crud.parse_membros_sort(sort)
+    campos = crud.parse_membros_fields(fields) if fields is not None else None
+    after_key = crud.decode_membros_cursor(after, sort) if after is not None else None
+    listagem = dict(include_planos=include_planos, filtros=filtros, sort=sort, fields=campos)
+    if stream:
+        if campos is not None:
+            schema = membro_projection(campos, include_planos)
+        else:
+            schema = schemas.MembroComPlanos if include_planos else schemas.Membro
+        return StreamingResponse(stream_ndjson(crud.iter_membros, schema, after_key, **listagem), media_type="application/x-ndjson")
+
+    membros = crud.get_all_membros(db, limit, after_key, **listagem)
+    headers = {}
+    if limit is not None and len(membros) == limit:
+        headers["X-Next-Cursor"] = crud.encode_membros_cursor(membros[-1], sort)
+    if campos is not None:
+        adapter = membros_projection_adapter(campos, include_planos)
+    else:
+        adapter = membros_com_planos_adapter if include_planos else membros_adapter
+    return json_response(adapter, membros, headers)
+
+@app.get("/planos", response_model=list[schemas.Plano], responses={400: {"description": "Error - cursor inválido"},
+                                                                   200: {"description": "Success - planos retornados", "content": {"application/x-ndjson": {}}},
+                                                                   304: {"description": "Not Modified - os planos não mudaram desde o ETag enviado em If-None-Match"}})
+def read_planos(request: Request, limit: Union[int, None] = Query(None, ge=1, le=1000), after: Union[str, None] = None,
+                stream: bool = False, db: Session = Depends(get_db)):
+    """Retorna uma lista com todos os planos cadastrados na academia.
 
-@app.get("/planos", response_model=list[schemas.Plano])
-def read_planos(db: Session = Depends(get_db)):
-    """Retorna uma lista com todos os planos cadastrados na academia."""
-    return crud.get_all_planos(db)
+    Com `limit`, retorna uma página e o cabeçalho `X-Next-Cursor` com o token a ser passado em `after` para buscar a próxima.
+    Com `stream=true`, retorna todos os planos (a partir de `after`) em NDJSON, sem carregar a tabela inteira em memória.
+    A resposta traz um `ETag`: com `If-None-Match`, retorna 304 sem corpo enquanto os planos não mudarem."""
+    after_id = crud.decode_cursor(after) if after is not None else None
+    if stream:
+        return StreamingResponse(stream_ndjson(crud.iter_planos, schemas.Plano, after_id), media_type="application/x-ndjson")
+
+    headers = etags.conditional(request, etags.CACHE_CONTROL_PLANOS, etags.PLANOS)
+    planos = crud.get_all_planos_cached(db, limit, after_id)
+    if limit is not None and len(planos) == limit:
+        headers["X-Next-Cursor"] = crud.encode_cursor(planos[-1].id_plano)
+    return json_response(planos_adapter, planos, headers)
 
 @app.get("/membro/{id_membro}", response_model=schemas.Membro, responses={400: {"description": "Error - membro não existe"}})
-def read_membro_id(id_membro: int, db: Session = Depends(get_db)):
-    """Retorna o membro cadastrado que possui um determinado id."""
-    return crud.get_membro(db, id_membro)
+def read_membro_id(id_membro: int, response: Response, include: Union[Literal["planos"], None] = IncludeQuery, db: Session = Depends(get_db)):
+    """Retorna o membro cadastrado que possui um determinado id. Com `include=planos`, traz também a lista `planos`.
+    A resposta traz a versão do membro no `ETag`, para o `If-Match` do `PATCH /membro`."""
+    db_membro = crud.get_membro(db, id_membro, include_planos=include == "planos")
+    headers = {"ETag": etags.row_etag(db_membro.versao)}
+    if include == "planos":
+        return json_response(membro_com_planos_adapter, db_membro, headers)
+    response.headers.update(headers)
+    return db_membro
 
-@app.get("/plano/{id_plano}", response_model=schemas.Plano, responses={400: {"description": "Error - plano não existe"}})
-def read_plano_id(id_plano: int, db: Session = Depends(get_db)):
-    """Retorna o plano cadastrado que possui um determinado id."""
-    return crud.get_plano(db, id_plano)
+@app.get("/plano/{id_plano}", response_model=schemas.Plano, responses={400: {"description": "Error - plano não existe"},
+                                                                         304: {"description": "Not Modified - o plano não mudou desde o ETag enviado em If-None-Match"}})
+def read_plano_id(id_plano: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    """Retorna o plano cadastrado que possui um determinado id. Com `If-None-Match`, retorna 304 sem corpo enquanto os planos não mudarem.
+    Requisições idênticas simultâneas compartilham a mesma consulta ao banco."""
+    response.headers.update(etags.conditional(request, etags.CACHE_CONTROL_PLANOS, etags.PLANOS))
+    return coalescing.flights.run(("GET /plano/{id_plano}", id_plano), (etags.PLANOS,), lambda: crud.get_plano_cached(db, id_plano))
 
 @app.get("/membros/ativos", response_model=list[schemas.Membro], responses={200: {"description": "Success - membros ativos retornados"},
                                                                             400: {"description": "Error - nenhum membro com plano ativo"}})
-def read_membros_ativos(db: Session = Depends(get_db)):
-    """Retorna uma lista com todos os membros ativos cadastrados na academia."""
-    return crud.get_membros_ativos(db)
+def read_membros_ativos(include: Union[Literal["planos"], None] = IncludeQuery, db: Session = Depends(get_db)):
+    """Retorna uma lista com todos os membros ativos cadastrados na academia. Com `include=planos`, cada membro traz a lista `planos`."""
+    if include == "planos":
+        return json_response(membros_com_planos_adapter, crud.get_membros_ativos(db, include_planos=True))
+    return json_response(membros_adapter, crud.get_membros_ativos(db))
 
 @app.get("/membros/{id_plano}", response_model=list[schemas.Membro], responses={400: {"description": "Error - plano não existe"},
                                                                                 400: {"description": "Error - nenhum membro com esse plano"},
                                                                                 200: {"description": "Success - membros com esse plano retornados"}})
-def read_membros_plano(id_plano: int, db: Session = Depends(get_db)):
-    """Retorna uma lista com todos os membros cadastrados em um determinado plano da academia."""
-    return crud.get_membros_plano(db, id_plano)
+def read_membros_plano(id_plano: int, include: Union[Literal["planos"], None] = IncludeQuery, db: Session = Depends(get_db)):
+    """Retorna uma lista com todos os membros cadastrados em um determinado plano da academia. Com `include=planos`, cada membro traz a lista `planos`.
+    Requisições idênticas simultâneas compartilham a mesma consulta ao banco."""
+    adapter = membros_com_planos_adapter if include == "planos" else membros_adapter
+    body = coalescing.flights.run(
+        ("GET /membros/{id_plano}", id_plano, include), (etags.MEMBROS, etags.PLANOS, etags.MEMBRO_PLANO),
+        lambda: dump_json(adapter, crud.get_membros_plano(db, id_plano, include_planos=include == "planos")),
+    )
+    return Response(body, media_type="application/json")
 
-@app.get("/planos/{id_membro}", response_model=list[schemas.Plano])
-def read_planos_membro(id_membro: int, db: Session = Depends(get_db)):
-    """Retorna uma lista com todos os planos cadastrados de um determinado membro da academia."""
-    return crud.get_planos_membro(db, id_membro)
+@app.get("/planos/{id_membro}", response_model=list[schemas.Plano], responses={304: {"description": "Not Modified - os planos do membro não mudaram desde o ETag enviado em If-None-Match"}})
+def read_planos_membro(id_membro: int, request: Request, db: Session = Depends(get_db)):
+    """Retorna uma lista com todos os planos cadastrados de um determinado membro da academia. Com `If-None-Match`, retorna 304 sem corpo enquanto eles não mudarem."""
+    headers = etags.conditional(request, etags.CACHE_CONTROL_PLANOS_MEMBRO, etags.MEMBROS, etags.PLANOS, etags.MEMBRO_PLANO)
+    return json_response(planos_adapter, crud.get_planos_membro(db, id_membro), headers)
 
 # ==== POST ====
 
 @app.post("/membro", response_model=schemas.Membro, responses={400: {"description": "Error - membro já existe"},
                                                                 200: {"description": "Success - membro criado", "content": {"application/json": {"example": {"id_membro": 1}}}}})
-def create_membro(membro: schemas.MembroCreate, db: Session = Depends(get_db)):
+async def create_membro(membro: schemas.MembroCreate, db: Session = Depends(get_db)):
     """Cria um novo membro na academia."""
-    return crud.create_membro(db, membro)
+    # The hash is awaited on the event loop, a threadpool slot is only taken for the insert
+    hashed_password = await hashing.hash_password_async(f'{membro.password}')
+    return await run_in_threadpool(crud.create_membro, db, membro, hashed_password)
 
 @app.post("/plano", response_model=schemas.Plano, responses={400: {"description": "Error - plano já existe"},
                                                               200: {"description": "Success - plano criado", "content": {"application/json": {"example": {"id_plano": 1}}}}})
@@ -69,19 +237,51 @@ def create_plano(plano: schemas.PlanoCreate, db: Session = Depends(get_db)):
     """Cria um novo plano na academia."""
     return crud.create_plano(db, plano)
 
+@app.post("/membros/bulk", response_model=schemas.BulkResultado, responses={400: {"description": "Error - corpo deve ser um array JSON ou NDJSON"},
+                                                                             200: {"description": "Success - membros importados", "content": {"application/json": {"example": {"inseridos": 2, "erros": [{"linha": 3, "id": 1, "detail": "Error - membro já existe"}]}}}}})
+async def create_membros_bulk(request: Request, db: Session = Depends(get_db)):
+    """Importa membros em lote, a partir de um array JSON ou de um stream NDJSON (`Content-Type: application/x-ndjson`).
+
+    Cada linha tem o formato do `POST /membro`. As linhas válidas são inseridas em blocos, cada bloco em uma transação,
+    e as linhas rejeitadas são retornadas com o motivo."""
+    return await bulk_import(request, db, crud.create_membros_bulk)
+
+@app.post("/planos/bulk", response_model=schemas.BulkResultado, responses={400: {"description": "Error - corpo deve ser um array JSON ou NDJSON"},
+                                                                           200: {"description": "Success - planos importados", "content": {"application/json": {"example": {"inseridos": 2, "erros": [{"linha": 3, "id": 1, "detail": "Error - plano já existe"}]}}}}})
+async def create_planos_bulk(request: Request, db: Session = Depends(get_db)):
+    """Importa planos em lote, a partir de um array JSON ou de um stream NDJSON (`Content-Type: application/x-ndjson`).
+
+    Cada linha tem o formato do `POST /plano`. As linhas válidas são inseridas em blocos, cada bloco em uma transação,
+    e as linhas rejeitadas são retornadas com o motivo."""
+    return await bulk_import(request, db, crud.create_planos_bulk)
+
 # ==== PATCH ====
 
 @app.patch("/membro", response_model=schemas.Membro, responses={400: {"description": "Error - membro não existe"},
+                                                                 412: {"description": "Error - membro foi alterado desde a versão enviada em If-Match"},
                                                                  200: {"description": "Success - membro atualizado", "content": {"application/json": {"example": {"id_membro": 1}}}}})
-def update_membro(membro: schemas.Membro, db: Session = Depends(get_db)):
-    """Atualiza as informações de um membro."""
-    return crud.update_membro(db, membro, membro.id_membro)
+async def update_membro(membro: schemas.MembroUpdate, response: Response, if_match: Union[str, None] = Header(None), db: Session = Depends(get_db)):
+    """Atualiza as informações de um membro. Só os campos enviados são alterados, e a senha só quando `password` é enviado.
+
+    Com `If-Match: "<versao>"`, só altera o membro se ele ainda estiver nessa versão, senão retorna 412.
+    A resposta traz a nova versão no `ETag`."""
+    versao = etags.parse_if_match(if_match)
+    hashed_password = await hashing.hash_password_async(f'{membro.password}') if membro.password is not None else None
+    db_membro = await run_in_threadpool(crud.update_membro, db, membro, membro.id_membro, versao, hashed_password)
+    response.headers["ETag"] = etags.row_etag(db_membro["versao"])
+    return db_membro
 
 @app.patch("/plano", response_model=schemas.Plano, responses={400: {"description": "Error - plano não existe"},
+                                                               412: {"description": "Error - plano foi alterado desde a versão enviada em If-Match"},
                                                                200: {"description": "Success - plano atualizado", "content": {"application/json": {"example": {"id_plano": 1}}}}})
-def update_plano(plano: schemas.Plano, db: Session = Depends(get_db)):
-    """Atualiza as informações de um plano."""
-    return crud.update_plano(db, plano, plano.id_plano)
+def update_plano(plano: schemas.PlanoUpdate, response: Response, if_match: Union[str, None] = Header(None), db: Session = Depends(get_db)):
+    """Atualiza as informações de um plano. Só os campos enviados são alterados.
+
+    Com `If-Match: "<versao>"`, só altera o plano se ele ainda estiver nessa versão, senão retorna 412.
+    A resposta traz a nova versão no `ETag`."""
+    db_plano = crud.update_plano(db, plano, plano.id_plano, etags.parse_if_match(if_match))
+    response.headers["ETag"] = etags.row_etag(db_plano["versao"])
+    return db_plano
 
 # ==== PUT ====
 
@@ -93,6 +293,13 @@ def update_membro_plano(id_membro: int, id_plano: int, db: Session = Depends(get
     """Adiciona um plano a um membro."""
     return crud.update_membro_plano(db, id_membro, id_plano)
 
+@app.put("/membros/planos", response_model=schemas.MembrosPlanosBulkResultado, responses={200: {"description": "Success - planos adicionados aos membros", "content": {"application/json": {"example": {"aplicados": [{"id_membro": 1, "id_plano": 2}], "ignorados": [{"id_membro": 3, "id_plano": 2, "detail": "Error - membro já tem esse plano"}]}}}}})
+def update_membros_planos(lote: schemas.MembrosPlanosBulk, db: Session = Depends(get_db)):
+    """Adiciona planos a vários membros de uma vez, a partir de uma lista de pares ou de um plano e uma lista de membros.
+
+    Os pares cujo membro ou plano não existe, ou que já existem, são ignorados e retornados com o motivo."""
+    return crud.update_membros_planos(db, lote.get_pares())
+
 # ==== DELETE ====
 
 @app.delete("/membro/{id_membro}", response_model=dict[str, int], responses={400: {"description": "Error - membro não existe"},
@@ -115,6 +322,115 @@ def delete_membro_plano(id_membro: int, id_plano: int, db: Session = Depends(get
     """Remove um plano de um membro."""
     return crud.delete_membro_plano(db, id_membro, id_plano)
 
+@app.delete("/membros/planos", response_model=schemas.MembrosPlanosBulkResultado, responses={200: {"description": "Success - planos removidos dos membros", "content": {"application/json": {"example": {"aplicados": [{"id_membro": 1, "id_plano": 2}], "ignorados": [{"id_membro": 3, "id_plano": 2, "detail": "Error - membro não tem esse plano"}]}}}}})
+def delete_membros_planos(lote: schemas.MembrosPlanosBulk, db: Session = Depends(get_db)):
+    """Remove planos de vários membros de uma vez, a partir de uma lista de pares ou de um plano e uma lista de membros.
+
+    Os pares cujo membro ou plano não existe, ou que não existem, são ignorados e retornados com o motivo."""
+    return crud.delete_membros_planos(db, lote.get_pares())
+
+# ==== STATS ====
+
+@app.get("/stats/planos", response_model=schemas.StatsPlanos)
+def read_stats_planos(db: Session = Depends(get_db)):
+    """Retorna, para cada plano, a quantidade de membros e a receita mensal (preço x membros)."""
+    return stats.get_report(db, "planos")
+
+@app.get("/stats/receita", response_model=schemas.StatsReceita)
+def read_stats_receita(db: Session = Depends(get_db)):
+    """Retorna a receita mensal da academia, somando os planos ativos de todos os membros."""
+    return stats.get_report(db, "receita")
+
+@app.get("/stats/inscricoes", response_model=schemas.StatsInscricoes)
+def read_stats_inscricoes(db: Session = Depends(get_db)):
+    """Retorna a quantidade de inscrições na academia por mês."""
+    return stats.get_report(db, "inscricoes")
+
+@app.get("/stats/sexos", response_model=schemas.StatsSexos)
+def read_stats_sexos(db: Session = Depends(get_db)):
+    """Retorna a quantidade de membros de cada sexo."""
+    return stats.get_report(db, "sexos")
+
+# ==== CHANGES ====
+
+def poll_changes(since: int, limit: int):
+    # The stream owns its sessions, one per poll, since it outlives the request handler
+    with SessionLocal() as db:
+        return [schemas.Alteracao.model_validate(alteracao) for alteracao in changes.get_changes(db, since, limit)]
+
+async def stream_changes(alteracoes: list, since: int):
+    # Send what is pending, then poll the outbox for new entries, with a comment now and then to keep the connection open
+    ocioso = 0.0
+    while True:
+        if alteracoes:
+            yield "".join(changes.sse_event(alteracao) for alteracao in alteracoes)
+            since = alteracoes[-1].id
+            ocioso = 0.0
+        elif ocioso >= changes.CHANGES_KEEPALIVE:
+            yield ": keepalive\n\n"
+            ocioso = 0.0
+        await asyncio.sleep(changes.CHANGES_POLL_INTERVAL)
+        ocioso += changes.CHANGES_POLL_INTERVAL
+        alteracoes = await run_in_threadpool(poll_changes, since, changes.STREAM_LIMIT)
+
+@app.get("/changes", response_model=schemas.Alteracoes, responses={410: {"description": "Error - cursor expirado, refaça a listagem completa"}})
+def read_changes(since: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db)):
+    """Retorna, em ordem, as criações, alterações e remoções de membros, planos e planos dos membros feitas depois de `since`.
+
+    Em vez de listar tudo de novo, passe o `cursor` da resposta em `since` para buscar só as próximas.
+    Se as alterações depois de `since` já foram descartadas (ver `CHANGES_RETENTION`), retorna 410: refaça a listagem completa."""
+    alteracoes = changes.get_changes(db, since, limit)
+    return schemas.Alteracoes(alteracoes=alteracoes, cursor=alteracoes[-1].id if alteracoes else since)
+
+@app.get("/changes/stream", responses={200: {"description": "Success - alterações enviadas conforme acontecem", "content": {"text/event-stream": {}}},
+                                        410: {"description": "Error - cursor expirado, refaça a listagem completa"}})
+async def read_changes_stream(since: int = Query(0, ge=0), last_event_id: Union[str, None] = Header(None)):
+    """Envia as alterações feitas depois de `since` como Server-Sent Events, e as novas conforme acontecem.
+
+    O `id` de cada evento é o cursor: ao reconectar, o `EventSource` o envia em `Last-Event-ID` e o stream continua dali."""
+    since = changes.sse_since(since, last_event_id)
+    # The first poll runs before the response starts, so an expired cursor is still answered with a 410
+    alteracoes = await run_in_threadpool(poll_changes, since, changes.STREAM_LIMIT)
+    return StreamingResponse(stream_changes(alteracoes, since), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# ==== METRICS ====
+
+@app.get("/metrics/hashing")
+def read_metrics_hashing():
+    """Retorna as métricas do pool de hashing de senhas (fila, quantidade e duração dos hashes)."""
+    return hashing.get_metrics()
+
+@app.get("/metrics/pool")
+def read_metrics_pool():
+    """Retorna o estado e os contadores do pool de conexões com o banco (conexões em uso, overflow, tempo de espera)."""
+    return pool_metrics.get_metrics(engine)
+
+@app.get("/metrics/cache")
+def read_metrics_cache():
+    """Retorna os acertos, faltas e invalidações dos caches de planos e de estatísticas, as versões das tabelas usadas nos ETags e quantas respostas 304 foram dadas."""
+    return dict(cache.get_metrics(), etags=etags.get_metrics())
+
+@app.get("/metrics/sql")
+def read_metrics_sql():
+    """Retorna, por rota, a quantidade de consultas SQL e o tempo gasto no banco, com histogramas por requisição."""
+    return instrumentation.get_metrics()
+
+@app.get("/metrics/coalescing")
+def read_metrics_coalescing():
+    """Retorna, por rota, quantas consultas foram feitas, quantas requisições aproveitaram uma consulta idêntica em andamento e quantas desistiram de esperar."""
+    return coalescing.get_metrics()
+
+
+# ==== HEALTH ====
+
+@app.get("/ready", responses={503: {"description": "Error - worker ainda não está pronto"}})
+def read_ready():
+    """Retorna 200 quando o worker já abriu as conexões com o banco e carregou o cache de planos, senão 503.
+    Enquanto não estiver pronto, cada chamada tenta o aquecimento de novo (ex: o banco subiu depois da aplicação)."""
+    if not warmup.is_ready() and not warmup.warmup(engine, SessionLocal):
+        raise HTTPException(status_code=503, detail="Error - worker ainda não está pronto")
+    return {"ready": True}
+
 
 # / path
 @app.get("/")
@@ -0,0 +1,298 @@
+import asyncio
+from typing import Union
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import cache, changes, coalescing, crud, crud_async, etags, hashing, instrumentation, models, pool_metrics, schemas, warmup
+from .serialization import dump_json, json_response, membro_projection, membros_adapter, membros_projection_adapter, planos_adapter
+from .database import CREATE_TABLES
+from .database_async import AsyncSessionLocal, async_engine, get_async_db
+
+# Async version of sql_app.main, served with: uvicorn sql_app.main_async:app
+# Every route is a coroutine running on the event loop, so throughput isn't capped by the threadpool size
+
+app = FastAPI(default_response_class=ORJSONResponse)
+app.add_middleware(instrumentation.SQLMetricsMiddleware)
+
+# Number of rows fetched from the database per chunk when streaming NDJSON
+STREAM_CHUNK_SIZE = 1000
+
+@app.on_event("startup")
+async def warm_up():
+    if CREATE_TABLES:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+    await warmup.warmup_async(async_engine)
+
+@app.on_event("startup")
+async def start_changes_pruner():
+    changes.start_pruner()
+
+@app.on_event("shutdown")
+async def shutdown():
+    hashing.shutdown()
+    changes.stop_pruner()
+    await async_engine.dispose()
+
+async def stream_ndjson(iter_rows, schema, after, **kwargs):
+    # The stream owns its session, since it outlives the request handler
+    async with AsyncSessionLocal() as db:
+        async for chunk in iter_rows(db, after, STREAM_CHUNK_SIZE, **kwargs):
+            yield "".join(schema.model_validate(row).model_dump_json() + "\n" for row in chunk)
+
+# ==== GET ====
+
+@app.get("/membros", response_model=list[schemas.Membro], responses={400: {"description": "Error - cursor inválido"},
+                                                                     200: {"description": "Success - membros retornados", "content": {"application/x-ndjson": {}}}})
+async def read_membros(limit: Union[int, None] = Query(None, ge=1, le=1000), after: Union[str, None] = None,
+                 stream: bool = False,
+                 sort: str = Query("id_membro", description=f"Coluna de ordenação, com `-` na frente para ordem decrescente: {', '.join(crud.MEMBROS_SORT_KEYS)}"),
+                 fields: Union[str, None] = Query(None, description=f"Campos retornados, separados por vírgula: {', '.join(crud.MEMBROS_FIELDS)}"),
+                 filtros: schemas.MembrosFiltro = Depends(), db: AsyncSession = Depends(get_async_db)):
+    """Retorna uma lista com todos os membros cadastrados na academia.
+
+    Com `limit`, retorna uma página e o cabeçalho `X-Next-Cursor` com o token a ser passado em `after` para buscar a próxima.
+    Com `stream=true`, retorna todos os membros (a partir de `after`) em NDJSON, sem carregar a tabela inteira em memória.
+    Os filtros (início do nome, sexo, intervalos de inscrição, nascimento e peso), a ordenação `sort` e a projeção `fields`
+    viram uma única consulta no banco; com `fields`, só as colunas pedidas são lidas e a senha nunca é retornada."""
+    crud.parse_membros_sort(sort)
+    campos = crud.parse_membros_fields(fields) if fields is not None else None
+    after_key = crud.decode_membros_cursor(after, sort) if after is not None else None
+    listagem = dict(filtros=filtros, sort=sort, fields=campos)
+    if stream:
+        schema = membro_projection(campos) if campos is not None else schemas.Membro
+        return StreamingResponse(stream_ndjson(crud_async.iter_membros, schema, after_key, **listagem), media_type="application/x-ndjson")
+
+    membros = await crud_async.get_all_membros(db, limit, after_key, **listagem)
+    headers = {}
+    if limit is not None and len(membros) == limit:
+        headers["X-Next-Cursor"] = crud.encode_membros_cursor(membros[-1], sort)
+    adapter = membros_projection_adapter(campos) if campos is not None else membros_adapter
+    return json_response(adapter, membros, headers)
+
+@app.get("/planos", response_model=list[schemas.Plano], responses={400: {"description": "Error - cursor inválido"},
+                                                                   200: {"description": "Success - planos retornados", "content": {"application/x-ndjson": {}}},
+                                                                   304: {"description": "Not Modified - os planos não mudaram desde o ETag enviado em If-None-Match"}})
+async def read_planos(request: Request, limit: Union[int, None] = Query(None, ge=1, le=1000), after: Union[str, None] = None,
+                stream: bool = False, db: AsyncSession = Depends(get_async_db)):
+    """Retorna uma lista com todos os planos cadastrados na academia.
+
+    Com `limit`, retorna uma página e o cabeçalho `X-Next-Cursor` com o token a ser passado em `after` para buscar a próxima.
+    Com `stream=true`, retorna todos os planos (a partir de `after`) em NDJSON, sem carregar a tabela inteira em memória.
+    A resposta traz um `ETag`: com `If-None-Match`, retorna 304 sem corpo enquanto os planos não mudarem."""
+    after_id = crud.decode_cursor(after) if after is not None else None
+    if stream:
+        return StreamingResponse(stream_ndjson(crud_async.iter_planos, schemas.Plano, after_id), media_type="application/x-ndjson")
+
+    headers = etags.conditional(request, etags.CACHE_CONTROL_PLANOS, etags.PLANOS)
+    planos = await crud_async.get_all_planos(db, limit, after_id)
+    if limit is not None and len(planos) == limit:
+        headers["X-Next-Cursor"] = crud.encode_cursor(planos[-1].id_plano)
+    return json_response(planos_adapter, planos, headers)
+
+@app.get("/membro/{id_membro}", response_model=schemas.Membro, responses={400: {"description": "Error - membro não existe"}})
+async def read_membro_id(id_membro: int, response: Response, db: AsyncSession = Depends(get_async_db)):
+    """Retorna o membro cadastrado que possui um determinado id. A resposta traz a versão do membro no `ETag`, para o `If-Match` do `PATCH /membro`."""
+    db_membro = await crud_async.get_membro(db, id_membro)
+    response.headers["ETag"] = etags.row_etag(db_membro.versao)
+    return db_membro
+
+@app.get("/plano/{id_plano}", response_model=schemas.Plano, responses={400: {"description": "Error - plano não existe"},
+                                                                         304: {"description": "Not Modified - o plano não mudou desde o ETag enviado em If-None-Match"}})
+async def read_plano_id(id_plano: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    """Retorna o plano cadastrado que possui um determinado id. Com `If-None-Match`, retorna 304 sem corpo enquanto os planos não mudarem.
+    Requisições idênticas simultâneas compartilham a mesma consulta ao banco."""
+    response.headers.update(etags.conditional(request, etags.CACHE_CONTROL_PLANOS, etags.PLANOS))
+
+    async def load():
+        # Shared as a schema, the ORM row belongs to the session of the request that loaded it
+        return schemas.Plano.model_validate(await crud_async.get_plano(db, id_plano))
+
+    return await coalescing.flights.run_async(("GET /plano/{id_plano}", id_plano), (etags.PLANOS,), load)
+
+@app.get("/membros/ativos", response_model=list[schemas.Membro], responses={200: {"description": "Success - membros ativos retornados"},
+                                                                            400: {"description": "Error - nenhum membro com plano ativo"}})
+async def read_membros_ativos(db: AsyncSession = Depends(get_async_db)):
+    """Retorna uma lista com todos os membros ativos cadastrados na academia."""
+    return json_response(membros_adapter, await crud_async.get_membros_ativos(db))
+
+@app.get("/membros/{id_plano}", response_model=list[schemas.Membro], responses={400: {"description": "Error - plano não existe"},
+                                                                                400: {"description": "Error - nenhum membro com esse plano"},
+                                                                                200: {"description": "Success - membros com esse plano retornados"}})
+async def read_membros_plano(id_plano: int, db: AsyncSession = Depends(get_async_db)):
+    """Retorna uma lista com todos os membros cadastrados em um determinado plano da academia.
+    Requisições idênticas simultâneas compartilham a mesma consulta ao banco."""
+
+    async def load():
+        return dump_json(membros_adapter, await crud_async.get_membros_plano(db, id_plano))
+
+    body = await coalescing.flights.run_async(("GET /membros/{id_plano}", id_plano), (etags.MEMBROS, etags.PLANOS, etags.MEMBRO_PLANO), load)
+    return Response(body, media_type="application/json")
+
+@app.get("/planos/{id_membro}", response_model=list[schemas.Plano], responses={304: {"description": "Not Modified - os planos do membro não mudaram desde o ETag enviado em If-None-Match"}})
+async def read_planos_membro(id_membro: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Retorna uma lista com todos os planos cadastrados de um determinado membro da academia. Com `If-None-Match`, retorna 304 sem corpo enquanto eles não mudarem."""
+    headers = etags.conditional(request, etags.CACHE_CONTROL_PLANOS_MEMBRO, etags.MEMBROS, etags.PLANOS, etags.MEMBRO_PLANO)
+    return json_response(planos_adapter, await crud_async.get_planos_membro(db, id_membro), headers)
+
+# ==== POST ====
+
+@app.post("/membro", response_model=schemas.Membro, responses={400: {"description": "Error - membro já existe"},
+                                                                200: {"description": "Success - membro criado", "content": {"application/json": {"example": {"id_membro": 1}}}}})
+async def create_membro(membro: schemas.MembroCreate, db: AsyncSession = Depends(get_async_db)):
+    """Cria um novo membro na academia."""
+    return await crud_async.create_membro(db, membro)
+
+@app.post("/plano", response_model=schemas.Plano, responses={400: {"description": "Error - plano já existe"},
+                                                              200: {"description": "Success - plano criado", "content": {"application/json": {"example": {"id_plano": 1}}}}})
+async def create_plano(plano: schemas.PlanoCreate, db: AsyncSession = Depends(get_async_db)):
+    """Cria um novo plano na academia."""
+    return await crud_async.create_plano(db, plano)
+
+# ==== PATCH ====
+
+@app.patch("/membro", response_model=schemas.Membro, responses={400: {"description": "Error - membro não existe"},
+                                                                 412: {"description": "Error - membro foi alterado desde a versão enviada em If-Match"},
+                                                                 200: {"description": "Success - membro atualizado", "content": {"application/json": {"example": {"id_membro": 1}}}}})
+async def update_membro(membro: schemas.MembroUpdate, response: Response, if_match: Union[str, None] = Header(None), db: AsyncSession = Depends(get_async_db)):
+    """Atualiza as informações de um membro. Só os campos enviados são alterados, e a senha só quando `password` é enviado.
+
+    Com `If-Match: "<versao>"`, só altera o membro se ele ainda estiver nessa versão, senão retorna 412.
+    A resposta traz a nova versão no `ETag`."""
+    db_membro = await crud_async.update_membro(db, membro, membro.id_membro, etags.parse_if_match(if_match))
+    response.headers["ETag"] = etags.row_etag(db_membro["versao"])
+    return db_membro
+
+@app.patch("/plano", response_model=schemas.Plano, responses={400: {"description": "Error - plano não existe"},
+                                                               412: {"description": "Error - plano foi alterado desde a versão enviada em If-Match"},
+                                                               200: {"description": "Success - plano atualizado", "content": {"application/json": {"example": {"id_plano": 1}}}}})
+async def update_plano(plano: schemas.PlanoUpdate, response: Response, if_match: Union[str, None] = Header(None), db: AsyncSession = Depends(get_async_db)):
+    """Atualiza as informações de um plano. Só os campos enviados são alterados.
+
+    Com `If-Match: "<versao>"`, só altera o plano se ele ainda estiver nessa versão, senão retorna 412.
+    A resposta traz a nova versão no `ETag`."""
+    db_plano = await crud_async.update_plano(db, plano, plano.id_plano, etags.parse_if_match(if_match))
+    response.headers["ETag"] = etags.row_etag(db_plano["versao"])
+    return db_plano
+
+# ==== PUT ====
+
+@app.put("/membro/{id_membro}/plano/{id_plano}", response_model=dict[str, list[int]], responses={400: {"description": "Error - membro já tem esse plano"},
+                                                                                                   400: {"description": "Error - membro não existe"},
+                                                                                                   400: {"description": "Error - plano não existe"},
+                                                                                                   200: {"description": "Success - plano adicionado ao membro", "content": {"application/json": {"example": {"id_membro": 1, "ids_planos": [1,2]}}}}})
+async def update_membro_plano(id_membro: int, id_plano: int, db: AsyncSession = Depends(get_async_db)):
+    """Adiciona um plano a um membro."""
+    return await crud_async.update_membro_plano(db, id_membro, id_plano)
+
+# ==== DELETE ====
+
+@app.delete("/membro/{id_membro}", response_model=dict[str, int], responses={400: {"description": "Error - membro não existe"},
+                                                                              200: {"description": "Success - membro removido", "content": {"application/json": {"example": {"id_membro": 1}}}}})
+async def delete_membro(id_membro: int, db: AsyncSession = Depends(get_async_db)):
+    """Remove um membro da academia."""
+    return await crud_async.delete_membro(db, id_membro)
+
+@app.delete("/plano/{id_plano}", response_model=dict[str, int], responses={400: {"description": "Error - plano não existe"},
+                                                                            200: {"description": "Success - plano removido", "content": {"application/json": {"example": {"id_plano": 1}}}}})
+async def delete_plano(id_plano: int, db: AsyncSession = Depends(get_async_db)):
+    """Remove um plano da academia."""
+    return await crud_async.delete_plano(db, id_plano)
+
+@app.delete("/membro/{id_membro}/plano/{id_plano}", response_model=dict[str, list[int]], responses={400: {"description": "Error - membro não existe"},
+                                                                                                    400: {"description": "Error - plano não existe"},
+                                                                                                    400: {"description": "Error - membro não tem esse plano"},
+                                                                                                    200: {"description": "Success - plano removido do membro", "content": {"application/json": {"example": {"id_membro": 1, "ids_planos": [1]}}}}})
+async def delete_membro_plano(id_membro: int, id_plano: int, db: AsyncSession = Depends(get_async_db)):
+    """Remove um plano de um membro."""
+    return await crud_async.delete_membro_plano(db, id_membro, id_plano)
+
+# ==== CHANGES ====
+
+async def poll_changes(since: int, limit: int):
+    # The stream owns its sessions, one per poll, since it outlives the request handler
+    async with AsyncSessionLocal() as db:
+        return [schemas.Alteracao.model_validate(alteracao) for alteracao in await changes.get_changes_async(db, since, limit)]
+
+async def stream_changes(alteracoes: list, since: int):
+    # Send what is pending, then poll the outbox for new entries, with a comment now and then to keep the connection open
+    ocioso = 0.0
+    while True:
+        if alteracoes:
+            yield "".join(changes.sse_event(alteracao) for alteracao in alteracoes)
+            since = alteracoes[-1].id
+            ocioso = 0.0
+        elif ocioso >= changes.CHANGES_KEEPALIVE:
+            yield ": keepalive\n\n"
+            ocioso = 0.0
+        await asyncio.sleep(changes.CHANGES_POLL_INTERVAL)
+        ocioso += changes.CHANGES_POLL_INTERVAL
+        alteracoes = await poll_changes(since, changes.STREAM_LIMIT)
+
+@app.get("/changes", response_model=schemas.Alteracoes, responses={410: {"description": "Error - cursor expirado, refaça a listagem completa"}})
+async def read_changes(since: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000), db: AsyncSession = Depends(get_async_db)):
+    """Retorna, em ordem, as criações, alterações e remoções de membros, planos e planos dos membros feitas depois de `since`.
+
+    Em vez de listar tudo de novo, passe o `cursor` da resposta em `since` para buscar só as próximas.
+    Se as alterações depois de `since` já foram descartadas (ver `CHANGES_RETENTION`), retorna 410: refaça a listagem completa."""
+    alteracoes = await changes.get_changes_async(db, since, limit)
+    return schemas.Alteracoes(alteracoes=alteracoes, cursor=alteracoes[-1].id if alteracoes else since)
+
+@app.get("/changes/stream", responses={200: {"description": "Success - alterações enviadas conforme acontecem", "content": {"text/event-stream": {}}},
+                                        410: {"description": "Error - cursor expirado, refaça a listagem completa"}})
+async def read_changes_stream(since: int = Query(0, ge=0), last_event_id: Union[str, None] = Header(None)):
+    """Envia as alterações feitas depois de `since` como Server-Sent Events, e as novas conforme acontecem.
+
+    O `id` de cada evento é o cursor: ao reconectar, o `EventSource` o envia em `Last-Event-ID` e o stream continua dali."""
+    since = changes.sse_since(since, last_event_id)
+    # The first poll runs before the response starts, so an expired cursor is still answered with a 410
+    alteracoes = await poll_changes(since, changes.STREAM_LIMIT)
+    return StreamingResponse(stream_changes(alteracoes, since), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# ==== METRICS ====
+
+@app.get("/metrics/hashing")
+async def read_metrics_hashing():
+    """Retorna as métricas do pool de hashing de senhas (fila, quantidade e duração dos hashes)."""
+    return hashing.get_metrics()
+
+@app.get("/metrics/pool")
+async def read_metrics_pool():
+    """Retorna o estado e os contadores do pool de conexões com o banco (conexões em uso, overflow, tempo de espera)."""
+    return pool_metrics.get_metrics(async_engine)
+
+@app.get("/metrics/cache")
+async def read_metrics_cache():
+    """Retorna os acertos, faltas e invalidações do cache de planos, as versões das tabelas usadas nos ETags e quantas respostas 304 foram dadas."""
+    return dict(cache.get_metrics(), etags=etags.get_metrics())
+
+@app.get("/metrics/sql")
+async def read_metrics_sql():
+    """Retorna, por rota, a quantidade de consultas SQL e o tempo gasto no banco, com histogramas por requisição."""
+    return instrumentation.get_metrics()
+
+@app.get("/metrics/coalescing")
+async def read_metrics_coalescing():
+    """Retorna, por rota, quantas consultas foram feitas, quantas requisições aproveitaram uma consulta idêntica em andamento e quantas desistiram de esperar."""
+    return coalescing.get_metrics()
+
+# ==== HEALTH ====
+
+@app.get("/ready", responses={503: {"description": "Error - worker ainda não está pronto"}})
+async def read_ready():
+    """Retorna 200 quando o worker já abriu as conexões com o banco, senão 503.
+    Enquanto não estiver pronto, cada chamada tenta o aquecimento de novo (ex: o banco subiu depois da aplicação)."""
+    if not warmup.is_ready() and not await warmup.warmup_async(async_engine):
+        raise HTTPException(status_code=503, detail="Error - worker ainda não está pronto")
+    return {"ready": True}
+
+
+# / path
+@app.get("/")
+async def read_root():
+    return {"Hello": "World"}
+
+# uma request sem path
+@app.get("")
+async def read_root():
+    return {"Hello": "World"}
@@ -1,16 +1,20 @@
 # Importanto Tipos de Dados
-from sqlalchemy import Boolean, Column, Integer, Float, DateTime
+from sqlalchemy import BigInteger, Boolean, Column, Integer, Double, DateTime, Text
 from sqlalchemy.dialects.mysql import VARCHAR
 # Importando Relacionamentos e outros
-from sqlalchemy import ForeignKey, Table, CheckConstraint
+from sqlalchemy import ForeignKey, Table, CheckConstraint, Index, PrimaryKeyConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 
 
 # Defining N:N relationship between MembrosSQL and PlanosSQL
 membro_plano_association = Table('membro_plano_association', Base.metadata,
-    Column('membro_id', Integer, ForeignKey('membros.id_membro')),
-    Column('plano_id', Integer, ForeignKey('planos.id_plano'))
+    Column('membro_id', Integer, ForeignKey('membros.id_membro'), nullable=False),
+    Column('plano_id', Integer, ForeignKey('planos.id_plano'), nullable=False),
+    # Composite primary key, serves the "membros of a plano" lookup (plano_id -> membro_id)
+    PrimaryKeyConstraint('plano_id', 'membro_id', name='pk_membro_plano'),
+    # Reverse index, serves the "planos of a membro" lookup (membro_id -> plano_id)
+    Index('ix_membro_plano_membro_id_plano_id', 'membro_id', 'plano_id'),
 )
 
 
@@ -18,17 +22,24 @@ class MembrosSQL(Base):
     __tablename__ = "membros" # Nome da tabela no banco de dados
 
     # Definindo colunas
-    id_membro = Column(Integer, primary_key=True, index=True)
-    nome_membro = Column(VARCHAR(100), index=True)
-    peso = Column(Float, index=True)
-    sexo = Column(VARCHAR(1), index=True)
-    data_inscricao_plano_atual = Column(DateTime, index=True, nullable=True)
-    data_inscricao_academia = Column(DateTime, index=True)
-    data_nascimento = Column(DateTime, index=True)
-    rg = Column(VARCHAR(20), index=True)
-    hashed_password = Column(VARCHAR(200), index=True)
+    id_membro = Column(Integer, primary_key=True)
+    nome_membro = Column(VARCHAR(100))
+    peso = Column(Double) # DOUBLE no MySQL, onde o FLOAT não compara igual ao peso que os clientes enviam
+    sexo = Column(VARCHAR(1))
+    data_inscricao_plano_atual = Column(DateTime, nullable=True)
+    data_inscricao_academia = Column(DateTime)
+    data_nascimento = Column(DateTime)
+    rg = Column(VARCHAR(20))
+    hashed_password = Column(VARCHAR(200))
+    # Incremented by every update, for the If-Match of PATCH /membro
+    versao = Column(Integer, nullable=False, default=1, server_default='1')
 
     __table_args__ = (
+        # Filters and sort keys of GET /membros, each with the id that breaks the ties of the keyset pagination
+        Index('ix_membros_nome_membro_id_membro', 'nome_membro', 'id_membro'),
+        Index('ix_membros_peso_id_membro', 'peso', 'id_membro'),
+        Index('ix_membros_data_inscricao_academia_id_membro', 'data_inscricao_academia', 'id_membro'),
+        Index('ix_membros_data_nascimento_id_membro', 'data_nascimento', 'id_membro'),
         CheckConstraint('peso > 0', name='peso_positivo'),
         CheckConstraint('data_inscricao_academia > data_nascimento', name='data_inscricao_academia_valida'),
     )
@@ -40,16 +51,20 @@ class PlanosSQL(Base):
     __tablename__ = "planos" # Nome da tabela no banco de dados
 
     # Definindo colunas
-    id_plano = Column(Integer, primary_key=True, index=True)
-    nome_plano = Column(VARCHAR(100), index=True)
-    preco = Column(Float, index=True)
-    multa_valor_fidelidade = Column(Integer, index=True)
-    tempo_fidelidade = Column(Integer, index=True)
-    tempo_duracao = Column(Integer, index=True)
-    beneficios = Column(VARCHAR(500), index=True)
-    ativo = Column(Boolean, index=True)
+    id_plano = Column(Integer, primary_key=True)
+    nome_plano = Column(VARCHAR(100))
+    preco = Column(Double) # DOUBLE no MySQL, como o peso dos membros
+    multa_valor_fidelidade = Column(Integer)
+    tempo_fidelidade = Column(Integer)
+    tempo_duracao = Column(Integer)
+    beneficios = Column(VARCHAR(500))
+    ativo = Column(Boolean)
+    # Incremented by every update, for the If-Match of PATCH /plano
+    versao = Column(Integer, nullable=False, default=1, server_default='1')
 
     __table_args__ = (
+        # Active plans lookup (GET /membros/ativos), the only secondary index the queries need
+        Index('ix_planos_ativo_id_plano', 'ativo', 'id_plano'),
         CheckConstraint('preco > 0', name='preco_positivo'),
         CheckConstraint('multa_valor_fidelidade > 0', name='multa_valor_fidelidade_positivo'),
         CheckConstraint('tempo_fidelidade > 0', name='tempo_fidelidade_positivo'),
@@ -59,3 +74,30 @@ class PlanosSQL(Base):
     )
 
     membros = relationship("MembrosSQL", secondary=membro_plano_association, back_populates="planos")
+
+
+class EstatisticasSQL(Base):
+    __tablename__ = "estatisticas" # Resumo das estatísticas, recalculado periodicamente (ver sql_app/stats.py)
+
+    # Definindo colunas
+    nome = Column(VARCHAR(50), primary_key=True)
+    dados = Column(Text(16777215)) # Relatório serializado em JSON, MEDIUMTEXT no MySQL
+    atualizado_em = Column(DateTime, nullable=False)
+
+
+class AlteracoesSQL(Base):
+    __tablename__ = "alteracoes" # Log das escritas em membros, planos e na associação (ver sql_app/changes.py)
+
+    # Definindo colunas
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True) # Cursor do GET /changes
+    tabela = Column(VARCHAR(30), nullable=False)
+    operacao = Column(VARCHAR(10), nullable=False)
+    id_membro = Column(Integer, nullable=True)
+    id_plano = Column(Integer, nullable=True)
+    dados = Column(Text, nullable=True) # Novos valores das colunas alteradas, em JSON
+    criado_em = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        # Pruning of the entries older than the retention
+        Index('ix_alteracoes_criado_em', 'criado_em'),
+    )
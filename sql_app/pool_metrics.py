@@ -0,0 +1,99 @@
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class PoolMetrics:
+    """Counters for one connection pool, fed by the pool events and checkout timing."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {
+            "connects_total": 0,
+            "checkouts_total": 0,
+            "checkins_total": 0,
+            "invalidations_total": 0,
+            "timeouts_total": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def incr(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self._counters["wait_seconds_total"] += seconds
+            self._counters["wait_seconds_max"] = max(self._counters["wait_seconds_max"], seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+class _InstrumentedPoolMixin:
+    # Times every checkout, so the wait for a free connection shows up in the metrics
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        # Keep the counters when the pool is recreated (e.g. by engine.dispose())
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.metrics.incr("timeouts_total")
+            raise
+        finally:
+            self.metrics.record_wait(time.perf_counter() - started)
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument(engine):
+    # Pool events registered on the engine are carried over when its pool is recreated
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        engine.pool.metrics.incr("connects_total")
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        engine.pool.metrics.incr("checkouts_total")
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        engine.pool.metrics.incr("checkins_total")
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        engine.pool.metrics.incr("invalidations_total")
+
+def get_metrics(engine):
+    # Current pool state plus the accumulated counters
+    pool = engine.pool
+    if not isinstance(pool, _InstrumentedPoolMixin):
+        return {"status": pool.status()}
+    return dict(
+        pool.metrics.snapshot(),
+        size=pool.size(),
+        checked_in=pool.checkedin(),
+        checked_out=pool.checkedout(),
+        overflow=pool.overflow(),
+        max_overflow=pool._max_overflow,
+        timeout=pool.timeout(),
+    )
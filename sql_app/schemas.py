@@ -1,6 +1,15 @@
-from typing import List, Union
+from typing import Annotated, Any, List, Union
 from datetime import datetime
-from pydantic import BaseModel, Field
+from pydantic import AfterValidator, BaseModel, Field, Json, model_validator
+
+
+def _como_armazenada(data: datetime):
+    # The DATETIME columns keep neither the timezone (its wall clock time is stored) nor, on MySQL, the fraction of
+    # second: written as stored, the row read back and the value compared by a PATCH are what was sent
+    return data.replace(tzinfo=None, microsecond=0)
+
+# Datetime of a write
+DataArmazenada = Annotated[datetime, AfterValidator(_como_armazenada)]
 
 
 class MembroBase(BaseModel):
@@ -15,10 +24,33 @@ class MembroBase(BaseModel):
     rg: str = Field(..., description="RG do membro")
 
 class MembroCreate(MembroBase):
+    # The limits of the columns and their CHECK constraints, only on the way in: the rows written before them must
+    # still be readable through the response schemas. The dates are taken as stored, so the membro returned by the
+    # POST and the one sent to /changes are the row a GET returns
+    nome_membro: str = Field(..., max_length=100, description="Nome completo do membro")
+    peso: float = Field(..., gt=0, description="Peso do membro, em Kg")
+    sexo: str = Field(..., max_length=1, description="Sexo do membro")
+    data_inscricao_plano_atual: Union[DataArmazenada, None] = Field(None, description="Data de inscrição do membro no plano atual")
+    data_inscricao_academia: DataArmazenada = Field(..., description="Data de inscrição do membro na academia")
+    data_nascimento: DataArmazenada = Field(..., description="Data de nascimento do membro")
+    rg: str = Field(..., max_length=20, description="RG do membro")
     password: str = Field(..., description="Senha do membro")
 
+class MembroUpdate(BaseModel):
+    """Alteração parcial de um membro: só os campos enviados são alterados"""
+    id_membro: int = Field(..., ge=0, description="Identificador único do membro")
+    nome_membro: str = Field(None, max_length=100, description="Nome completo do membro")
+    peso: float = Field(None, gt=0, description="Peso do membro, em Kg")
+    sexo: str = Field(None, max_length=1, description="Sexo do membro")
+    data_inscricao_plano_atual: Union[DataArmazenada, None] = Field(None, description="Data de inscrição do membro no plano atual")
+    data_inscricao_academia: DataArmazenada = Field(None, description="Data de inscrição do membro na academia")
+    data_nascimento: DataArmazenada = Field(None, description="Data de nascimento do membro")
+    rg: str = Field(None, max_length=20, description="RG do membro")
+    password: str = Field(None, description="Nova senha do membro. Só com ela a senha é alterada")
+
 class Membro(MembroBase):
     hashed_password: str = Field(..., description="Senha do membro")
+    versao: int = Field(..., description="Versão do membro, a ser enviada em If-Match para alterá-lo só se ninguém o alterou antes")
     class Config:
         from_attributes = True
 
@@ -34,9 +66,145 @@ class PlanoBase(BaseModel):
     ativo: bool = Field(..., description="Se o plano está ativo ou não")
 
 class PlanoCreate(PlanoBase):
-    # Define fields specific to creating a new record, if needed
-    pass
+    # The limits of the columns and their CHECK constraints, only on the way in (see MembroCreate)
+    nome_plano: str = Field(..., max_length=100, description="Nome descritivo do plano")
+    preco: float = Field(..., gt=0, description="Valor mensal do plano, em Reais")
+    multa_valor_fidelidade: int = Field(..., gt=0, description="Valor da multa caso o membro cancele o plano antes do tempo de fidelidade, em Reais, maior que zero")
+    tempo_fidelidade: int = Field(..., gt=0, description="Tempo de fidelidade do plano, em meses, maior que zero")
+    tempo_duracao: int = Field(..., gt=0, description="Tempo de duração do plano, em meses")
+    beneficios: str = Field(..., max_length=500, description="Benefícios do plano, separados por vírgula e espaço. Ex: 'Mordomo, Chauffer, Treino 24h'")
+
+class PlanoUpdate(BaseModel):
+    """Alteração parcial de um plano: só os campos enviados são alterados"""
+    id_plano: int = Field(..., ge=0, description="Identificador único do plano")
+    nome_plano: str = Field(None, max_length=100, description="Nome descritivo do plano")
+    preco: float = Field(None, gt=0, description="Valor mensal do plano, em Reais")
+    multa_valor_fidelidade: int = Field(None, gt=0, description="Valor da multa caso o membro cancele o plano antes do tempo de fidelidade, em Reais")
+    tempo_fidelidade: int = Field(None, gt=0, description="Tempo de fidelidade do plano, em meses")
+    tempo_duracao: int = Field(None, gt=0, description="Tempo de duração do plano, em meses")
+    beneficios: str = Field(None, max_length=500, description="Benefícios do plano, separados por vírgula e espaço")
+    ativo: bool = Field(None, description="Se o plano está ativo ou não")
 
 class Plano(PlanoBase):
+    versao: int = Field(..., description="Versão do plano, a ser enviada em If-Match para alterá-lo só se ninguém o alterou antes")
+    class Config:
+        from_attributes = True
+
+class MembroComPlanos(Membro):
+    """Membro da academia, com os seus planos"""
+    planos: List[Plano] = Field(..., description="Planos do membro")
+
+class MembrosFiltro(BaseModel):
+    """Filtros da listagem de membros, todos opcionais e combinados com E"""
+    nome: Union[str, None] = Field(None, min_length=1, description="Início do nome do membro")
+    sexo: Union[str, None] = Field(None, description="Sexo do membro")
+    inscricao_de: Union[datetime, None] = Field(None, description="Inscritos na academia a partir desta data (inclusive)")
+    inscricao_ate: Union[datetime, None] = Field(None, description="Inscritos na academia até esta data (inclusive)")
+    nascimento_de: Union[datetime, None] = Field(None, description="Nascidos a partir desta data (inclusive)")
+    nascimento_ate: Union[datetime, None] = Field(None, description="Nascidos até esta data (inclusive)")
+    peso_min: Union[float, None] = Field(None, ge=0, description="Peso mínimo, em Kg (inclusive)")
+    peso_max: Union[float, None] = Field(None, ge=0, description="Peso máximo, em Kg (inclusive)")
+
+class BulkErro(BaseModel):
+    """Linha rejeitada de uma importação em lote"""
+    linha: int = Field(..., description="Posição da linha no array JSON ou número da linha no NDJSON, começando em 1")
+    id: Union[int, None] = Field(None, description="Identificador informado na linha, se houver")
+    detail: str = Field(..., description="Motivo da rejeição")
+
+class BulkResultado(BaseModel):
+    """Resultado de uma importação em lote"""
+    inseridos: int = Field(..., description="Quantidade de linhas inseridas")
+    erros: List[BulkErro] = Field(..., description="Linhas rejeitadas e o motivo")
+
+class MembroPlano(BaseModel):
+    """Par membro/plano"""
+    id_membro: int = Field(..., ge=0, description="Identificador do membro")
+    id_plano: int = Field(..., ge=0, description="Identificador do plano")
+
+class MembrosPlanosBulk(BaseModel):
+    """Lote de pares membro/plano, informados como uma lista de pares ou como um plano e uma lista de membros"""
+    pares: List[MembroPlano] = Field([], description="Pares membro/plano")
+    id_plano: Union[int, None] = Field(None, ge=0, description="Plano aplicado a todos os membros de ids_membro")
+    ids_membro: List[int] = Field([], description="Membros que recebem (ou perdem) o plano id_plano")
+
+    @model_validator(mode="after")
+    def check_pares(self):
+        if self.ids_membro and self.id_plano is None:
+            raise ValueError("id_plano é obrigatório junto com ids_membro")
+        if not self.pares and not self.ids_membro:
+            raise ValueError("informe pares ou id_plano e ids_membro")
+        return self
+
+    def get_pares(self):
+        # All the pairs of the batch, without repetitions and in the order they were sent
+        pares = [(par.id_membro, par.id_plano) for par in self.pares]
+        pares += [(id_membro, self.id_plano) for id_membro in self.ids_membro]
+        return list(dict.fromkeys(pares))
+
+class MembroPlanoIgnorado(MembroPlano):
+    """Par membro/plano que não foi aplicado"""
+    detail: str = Field(..., description="Motivo")
+
+class MembrosPlanosBulkResultado(BaseModel):
+    """Resultado de uma operação em lote sobre pares membro/plano"""
+    aplicados: List[MembroPlano] = Field(..., description="Pares adicionados (ou removidos)")
+    ignorados: List[MembroPlanoIgnorado] = Field(..., description="Pares ignorados e o motivo")
+
+class StatsPlano(BaseModel):
+    """Membros e receita mensal de um plano"""
+    id_plano: int = Field(..., description="Identificador do plano")
+    nome_plano: str = Field(..., description="Nome descritivo do plano")
+    ativo: bool = Field(..., description="Se o plano está ativo ou não")
+    preco: float = Field(..., description="Valor mensal do plano, em Reais")
+    membros: int = Field(..., description="Quantidade de membros com o plano")
+    receita_mensal: float = Field(..., description="Receita mensal do plano (preço x membros), em Reais")
+
+class StatsPlanos(BaseModel):
+    """Membros e receita mensal por plano"""
+    atualizado_em: datetime = Field(..., description="Momento em que as estatísticas foram calculadas")
+    planos: List[StatsPlano] = Field(..., description="Estatísticas de cada plano")
+
+class StatsReceita(BaseModel):
+    """Receita mensal da academia, somando os planos ativos de todos os membros"""
+    atualizado_em: datetime = Field(..., description="Momento em que as estatísticas foram calculadas")
+    receita_mensal: float = Field(..., description="Soma do preço dos planos ativos de cada membro, em Reais")
+    membros_pagantes: int = Field(..., description="Quantidade de membros com ao menos um plano ativo")
+    planos_ativos: int = Field(..., description="Quantidade de planos ativos com ao menos um membro")
+
+class StatsInscricoesMes(BaseModel):
+    """Inscrições na academia em um mês"""
+    ano: int = Field(..., description="Ano")
+    mes: int = Field(..., description="Mês, de 1 a 12")
+    inscricoes: int = Field(..., description="Quantidade de membros inscritos na academia no mês")
+
+class StatsInscricoes(BaseModel):
+    """Inscrições na academia por mês"""
+    atualizado_em: datetime = Field(..., description="Momento em que as estatísticas foram calculadas")
+    meses: List[StatsInscricoesMes] = Field(..., description="Meses com ao menos uma inscrição, em ordem cronológica")
+
+class StatsSexo(BaseModel):
+    """Quantidade de membros de um sexo"""
+    sexo: Union[str, None] = Field(..., description="Sexo dos membros")
+    membros: int = Field(..., description="Quantidade de membros")
+
+class StatsSexos(BaseModel):
+    """Distribuição dos membros por sexo"""
+    atualizado_em: datetime = Field(..., description="Momento em que as estatísticas foram calculadas")
+    sexos: List[StatsSexo] = Field(..., description="Quantidade de membros de cada sexo")
+
+class Alteracao(BaseModel):
+    """Escrita em um membro, plano ou na associação entre eles"""
+    id: int = Field(..., description="Posição da alteração no log, a ser passada em `since` para buscar as seguintes")
+    tabela: str = Field(..., description="Tabela alterada: membros, planos ou membro_plano_association")
+    operacao: str = Field(..., description="criacao, alteracao ou remocao. Remover um membro ou plano remove também as suas associações")
+    id_membro: Union[int, None] = Field(None, description="Membro alterado")
+    id_plano: Union[int, None] = Field(None, description="Plano alterado")
+    dados: Union[Json[Any], None] = Field(None, description="Novos valores das colunas escritas (nunca a senha), com a nova versao")
+    criado_em: datetime = Field(..., description="Momento da alteração")
     class Config:
         from_attributes = True
+
+class Alteracoes(BaseModel):
+    """Alterações feitas depois do cursor, em ordem"""
+    alteracoes: List[Alteracao] = Field(..., description="Alterações, em ordem")
+    cursor: int = Field(..., description="Valor de `since` para buscar as próximas alterações")
@@ -0,0 +1,35 @@
+from functools import lru_cache
+from typing import List
+from fastapi import Response
+from pydantic import ConfigDict, TypeAdapter, create_model
+from . import schemas
+
+# Routes returning a plain object go through the app's default ORJSONResponse. The list routes, where
+# serialization dominates, skip FastAPI's response_model pass: the ORM rows are validated and dumped
+# to JSON bytes by pydantic-core in one go, with no intermediate dicts.
+
+membros_adapter = TypeAdapter(list[schemas.Membro])
+planos_adapter = TypeAdapter(list[schemas.Plano])
+membro_com_planos_adapter = TypeAdapter(schemas.MembroComPlanos)
+membros_com_planos_adapter = TypeAdapter(list[schemas.MembroComPlanos])
+
+
+@lru_cache(maxsize=256)
+def membro_projection(fields: tuple, include_planos: bool = False):
+    # Schema with only the projected fields of MembroBase (so never hashed_password), plus planos with include_planos
+    definitions = {name: (schemas.MembroBase.model_fields[name].annotation, schemas.MembroBase.model_fields[name]) for name in fields}
+    if include_planos:
+        definitions["planos"] = (List[schemas.Plano], schemas.MembroComPlanos.model_fields["planos"])
+    return create_model("MembroProjecao", __config__=ConfigDict(from_attributes=True), **definitions)
+
+@lru_cache(maxsize=256)
+def membros_projection_adapter(fields: tuple, include_planos: bool = False):
+    return TypeAdapter(list[membro_projection(fields, include_planos)])
+
+
+def dump_json(adapter: TypeAdapter, content):
+    # Validate the ORM rows (or schema instances, kept as they are) and serialize them to JSON bytes in pydantic-core
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+
+def json_response(adapter: TypeAdapter, content, headers: dict = None):
+    return Response(dump_json(adapter, content), media_type="application/json", headers=headers)
@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import distinct, func, select
+from sqlalchemy.orm import Session
+from . import cache, models, schemas
+from .database import SessionLocal
+
+# Seconds between refreshes of the estatisticas summary table. With 0 (the default) the reports are
+# computed from the base tables, at most once per STATS_CACHE_TTL; otherwise they're read from the summary
+STATS_SUMMARY_REFRESH = float(os.getenv('STATS_SUMMARY_REFRESH', 0))
+
+logger = logging.getLogger("sql_app.stats")
+
+
+# ==== REPORTS ====
+
+def _planos(db: Session):
+    # Membros and monthly revenue of each plano, with a single GROUP BY over the association table
+    association = models.membro_plano_association
+    plano = models.PlanosSQL
+    membros = func.count(association.c.membro_id)
+    rows = db.execute(
+        select(plano.id_plano, plano.nome_plano, plano.ativo, plano.preco, membros.label("membros"), func.round(plano.preco * membros, 2).label("receita_mensal"))
+        .outerjoin(association, association.c.plano_id == plano.id_plano)
+        .group_by(plano.id_plano, plano.nome_plano, plano.ativo, plano.preco)
+        .order_by(plano.id_plano)
+    ).mappings()
+    return schemas.StatsPlanos(atualizado_em=datetime.now(), planos=[schemas.StatsPlano(**row) for row in rows])
+
+def _receita(db: Session):
+    # Each active plano of each membro is paid monthly
+    association = models.membro_plano_association
+    plano = models.PlanosSQL
+    row = db.execute(
+        select(
+            func.round(func.coalesce(func.sum(plano.preco), 0), 2).label("receita_mensal"),
+            func.count(distinct(association.c.membro_id)).label("membros_pagantes"),
+            func.count(distinct(plano.id_plano)).label("planos_ativos"),
+        )
+        .select_from(association)
+        .join(plano, plano.id_plano == association.c.plano_id)
+        .where(plano.ativo == True)
+    ).mappings().one()
+    return schemas.StatsReceita(atualizado_em=datetime.now(), **row)
+
+def _inscricoes(db: Session):
+    # Membros enrolled in the academia per month
+    membro = models.MembrosSQL
+    ano = func.extract("year", membro.data_inscricao_academia)
+    mes = func.extract("month", membro.data_inscricao_academia)
+    rows = db.execute(
+        select(ano.label("ano"), mes.label("mes"), func.count().label("inscricoes"))
+        .where(membro.data_inscricao_academia.is_not(None))
+        .group_by(ano, mes)
+        .order_by(ano, mes)
+    ).mappings()
+    return schemas.StatsInscricoes(atualizado_em=datetime.now(), meses=[schemas.StatsInscricoesMes(**row) for row in rows])
+
+def _sexos(db: Session):
+    # Membros per sexo
+    membro = models.MembrosSQL
+    rows = db.execute(
+        select(membro.sexo, func.count().label("membros")).group_by(membro.sexo).order_by(membro.sexo)
+    ).mappings()
+    return schemas.StatsSexos(atualizado_em=datetime.now(), sexos=[schemas.StatsSexo(**row) for row in rows])
+
+# Report name -> (schema, function that computes it from the base tables)
+REPORTS = {
+    "planos": (schemas.StatsPlanos, _planos),
+    "receita": (schemas.StatsReceita, _receita),
+    "inscricoes": (schemas.StatsInscricoes, _inscricoes),
+    "sexos": (schemas.StatsSexos, _sexos),
+}
+
+def get_report(db: Session, nome: str):
+    # Served from the stats cache; on a miss, read from the summary table when it's enabled and already filled, else computed
+    schema, compute = REPORTS[nome]
+
+    def load():
+        if STATS_SUMMARY_REFRESH > 0:
+            resumo = db.get(models.EstatisticasSQL, nome)
+            if resumo is not None:
+                return schema.model_validate_json(resumo.dados)
+        return compute(db)
+
+    return cache.stats.get_or_load(("stats", nome), load)
+
+
+# ==== SUMMARY TABLE ====
+
+def refresh_summary(db: Session, force: bool = False):
+    # Recompute every report into the estatisticas table, unless another worker refreshed it recently
+    if not force:
+        resumos, mais_antigo = db.execute(select(func.count(), func.min(models.EstatisticasSQL.atualizado_em))).one()
+        if resumos == len(REPORTS) and (datetime.now() - mais_antigo).total_seconds() < STATS_SUMMARY_REFRESH:
+            return False
+
+    for nome, (_, compute) in REPORTS.items():
+        report = compute(db)
+        db.merge(models.EstatisticasSQL(nome=nome, dados=report.model_dump_json(), atualizado_em=report.atualizado_em))
+    db.commit()
+    cache.stats.invalidate()
+    return True
+
+_stop = threading.Event()
+_refresher = None
+
+def _refresh_loop():
+    while not _stop.is_set():
+        try:
+            with SessionLocal() as db:
+                refresh_summary(db)
+        except Exception:
+            # Keep serving the last summary, and try again at the next interval
+            logger.exception("failed to refresh the estatisticas summary table")
+        _stop.wait(STATS_SUMMARY_REFRESH)
+
+def start_refresher():
+    # Refresh the summary table in a background thread, when STATS_SUMMARY_REFRESH is set
+    global _refresher
+    if STATS_SUMMARY_REFRESH <= 0 or _refresher is not None:
+        return
+    _stop.clear()
+    _refresher = threading.Thread(target=_refresh_loop, name="stats-refresher", daemon=True)
+    _refresher.start()
+
+def stop_refresher():
+    global _refresher
+    if _refresher is not None:
+        _stop.set()
+        _refresher.join()
+        _refresher = None
@@ -0,0 +1,56 @@
+import logging
+import os
+import threading
+from . import cache, crud, models
+from .database import DB_POOL_SIZE
+
+# Connections each worker opens at startup, before it reports ready. The pool keeps up to DB_POOL_SIZE open
+WARMUP_CONNECTIONS = min(int(os.getenv('WARMUP_CONNECTIONS', DB_POOL_SIZE)), DB_POOL_SIZE)
+
+logger = logging.getLogger("sql_app.warmup")
+
+_ready = threading.Event()
+
+def is_ready():
+    return _ready.is_set()
+
+def warmup(engine, session_factory):
+    # Open the pool connections ahead of the first requests, then load the planos into their cache.
+    # Reading the planos also checks that the migrations ran; on failure the worker serves, but isn't ready
+    try:
+        connections = []
+        try:
+            for _ in range(WARMUP_CONNECTIONS):
+                connections.append(engine.connect())
+        finally:
+            # Back to the pool, also the ones opened before a connect failed
+            for connection in connections:
+                connection.close()
+
+        with session_factory() as db:
+            for plano in crud.get_all_planos_cached(db):
+                cache.planos.get_or_load(("plano", plano.id_plano), lambda plano=plano: plano)
+    except Exception:
+        logger.exception("warmup failed, the worker isn't ready yet")
+        return False
+    _ready.set()
+    return True
+
+async def warmup_async(async_engine):
+    # Same as warmup, for sql_app.main_async: it doesn't cache the planos, so they're only read to check the schema
+    try:
+        connections = []
+        try:
+            for _ in range(WARMUP_CONNECTIONS):
+                connections.append(await async_engine.connect())
+        finally:
+            for connection in connections:
+                await connection.close()
+
+        async with async_engine.connect() as connection:
+            await connection.execute(models.PlanosSQL.__table__.select().limit(1))
+    except Exception:
+        logger.exception("warmup failed, the worker isn't ready yet")
+        return False
+    _ready.set()
+    return True